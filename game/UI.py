@@ -217,7 +217,7 @@ class DebugInterface:
         self.active = not self.active
         return self.active
 
-    def draw(self, win, p, players, fps, network_obj):
+    def draw(self, win, p, players, fps, network_obj, inputs=None):
         if not self.active: return
         win.blit(self.bg_surf, (10, 10))
         
@@ -228,14 +228,16 @@ class DebugInterface:
             f"--- SYSTEM ---",
             f"FPS: {int(fps)}",
             f"PING: {ping} ms",
-            f"ENTITIES: {len(players)}",
+            f"ENTITIES: {sum(1 for o in players.values() if o.in_view)}/{len(players)}",
             f"--- PLAYER ---",
             f"POS: ({int(p.x)}, {int(p.y)})",
             f"HP: {p.hp}",
+            f"PREDICTION ERR: {inputs.last_error:.1f} px" if inputs else "PREDICTION ERR: -",
             f"--- NETWORK ---",
             f"UP: {network_obj.traffic_stats['sent_per_sec']:.1f} KB/s",
             f"DOWN: {network_obj.traffic_stats['recv_per_sec']:.1f} KB/s",
             f"TOTAL RECV: {network_obj.traffic_stats['recv_total'] / 1024:.1f} KB",
+            f"ZLIB: {network_obj.reader.ratio * 100:.0f}%, {network_obj.reader.stats['cpu_ms']:.0f} ms CPU",
         ]
 
         y_offset = 20
@@ -328,8 +330,8 @@ def draw_scoreboard(surface, players, my_id):
     pygame.draw.rect(s, C_NEON_CYAN, s.get_rect(), 2, border_radius=10)
     
     # Заголовки
-    headers = ["NICKNAME", "KILLS", "DEATHS", "K/D", "PING"]
-    col_x = [30, 300, 400, 500, 600]
+    headers = ["NICKNAME", "KILLS", "DEATHS", "K/D", "PING", "KB/S"]
+    col_x = [30, 260, 350, 440, 520, 610]
     
     for i, head in enumerate(headers):
         FONT_TABLE.render_to(s, (col_x[i], 20), head, C_TEXT_DIM)
@@ -361,6 +363,8 @@ def draw_scoreboard(surface, players, my_id):
         ping_val = p.ping
         ping_col = (0,255,0) if ping_val < 60 else (255,255,0) if ping_val < 120 else (255,0,0)
         FONT_TABLE.render_to(s, (col_x[4], y_off), f"{ping_val}ms", ping_col)
+        # Скорость снапшотов этому игроку (у ботов 0)
+        FONT_TABLE.render_to(s, (col_x[5], y_off), str(p.rate), row_col)
         
         y_off += 30
         
@@ -0,0 +1,118 @@
+import math
+import numpy as np
+
+# --- ПУЛИ НА СЕРВЕРЕ ---
+# Все летящие пули лежат в одном хранилище - структуре массивов NumPy:
+# координаты, точка вылета, скорости, владелец, id, тик вылета, признак жизни. Шаг тика -
+# несколько векторных операций сразу на все пули, а не цикл по спискам игроков.
+# Исчезнувшая пуля освобождает слот, новый выстрел занимает свободный;
+# массивы только растут (удвоением), list.remove больше нет.
+# Точная проверка попаданий остается на pygame.Rect (server.hits_wall,
+# server.bullet_target) - векторно отбираются только кандидаты, задевшие
+# занятые клетки сетки столкновений (spatial.BoxGrid).
+
+BULLET_HALF = 5         # пуля - квадрат 10x10 вокруг точки
+INITIAL_CAPACITY = 256
+
+FIELDS = (("x", np.float64), ("y", np.float64), ("x0", np.float64), ("y0", np.float64),
+          ("vx", np.float64), ("vy", np.float64),
+          ("owner", np.int64), ("bullet_id", np.int64), ("spawn_tick", np.int64),
+          ("bot", np.bool_), ("alive", np.bool_))
+
+
+class BulletStore:
+    """Пули сервера. Слот - индекс во всех массивах сразу"""
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        for name, dtype in FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype))
+        self.free = list(range(capacity - 1, -1, -1))  # стек: младшие слоты первыми
+        self.count = 0
+
+    @property
+    def capacity(self):
+        return len(self.alive)
+
+    def _grow(self):
+        old = self.capacity
+        for name, _ in FIELDS:
+            arr = getattr(self, name)
+            grown = np.zeros(old * 2, arr.dtype)
+            grown[:old] = arr
+            setattr(self, name, grown)
+        self.free.extend(range(old * 2 - 1, old - 1, -1))
+
+    def add(self, bullet_id, owner, tick, x, y, vx, vy, bot=False):
+        """Новая пуля в свободный слот. bot - попадания по игрокам считает сервер"""
+        if not self.free: self._grow()
+        slot = self.free.pop()
+        self.x[slot], self.y[slot], self.vx[slot], self.vy[slot] = x, y, vx, vy
+        self.x0[slot], self.y0[slot] = x, y
+        self.owner[slot] = owner
+        self.bullet_id[slot] = bullet_id
+        self.spawn_tick[slot] = tick
+        self.bot[slot] = bot
+        self.alive[slot] = True
+        self.count += 1
+        return slot
+
+    def kill(self, slot):
+        if not self.alive[slot]: return
+        self.alive[slot] = False
+        self.free.append(int(slot))
+        self.count -= 1
+
+    def advance(self, k, tick):
+        """Пули сдвигаются на скорость * k, кроме вылетевших в тик tick
+        (мертвые слоты тоже двигаются - их никто не читает)"""
+        k = np.where(self.spawn_tick < tick, k, 0.0)
+        self.x += self.vx * k
+        self.y += self.vy * k
+
+    def max_speed(self):
+        """Наибольшая скорость живой пули (px за единицу шага advance)"""
+        if not self.count: return 0.0
+        return float(np.sqrt((self.vx[self.alive] ** 2 + self.vy[self.alive] ** 2).max()))
+
+    def outside(self, x0, y0, x1, y1):
+        """Слоты живых пуль не строго внутри (x0, x1) x (y0, y1)"""
+        x, y = self.x, self.y
+        inside = (x0 < x) & (x < x1) & (y0 < y) & (y < y1)
+        return np.flatnonzero(self.alive & ~inside)
+
+    def touching(self, cells, cell_size, bots_only=False):
+        """Слоты живых пуль, чей квадрат (с запасом в 1 px на округление Rect)
+        задевает хоть одну из клеток cells - ключей BoxGrid.cells.
+        Клетка должна быть больше пули: квадрат задевает не больше 2x2 клеток"""
+        mask = self.alive & self.bot if bots_only else self.alive
+        slots = np.flatnonzero(mask)
+        if not slots.size or not cells: return slots[:0]
+        # Занятые клетки -> плотная маска по их охвату с пустой рамкой в клетку:
+        # индексы за охватом прижимаются к рамке, дальше - индексация без поиска
+        cells = np.array(list(cells), np.int64)
+        origin = cells.min(axis=0) - 1
+        occupied = np.zeros(tuple(cells.max(axis=0) - origin + 2), np.bool_)
+        occupied[cells[:, 0] - origin[0], cells[:, 1] - origin[1]] = True
+        w, h = occupied.shape
+        r = BULLET_HALF + 1
+        x, y = self.x[slots], self.y[slots]
+        cxs = [np.clip(np.floor_divide(x + d, cell_size).astype(np.int64) - origin[0], 0, w - 1) for d in (-r, r)]
+        cys = [np.clip(np.floor_divide(y + d, cell_size).astype(np.int64) - origin[1], 0, h - 1) for d in (-r, r)]
+        hit = np.zeros(slots.size, np.bool_)
+        for cx in cxs:
+            for cy in cys:
+                hit |= occupied[cx, cy]
+        return slots[hit]
+
+    def of_owner(self, owner):
+        return np.flatnonzero(self.alive & (self.owner == owner))
+
+    def swept(self, slots, flight, spread, spacing):
+        """Точки пути пуль slots от вылета: от flight - spread до flight + spread
+        единиц шага advance (flight - у каждой свой), не реже чем через spacing px.
+        -> (xs, ys) формы (len(slots), точек на пулю)"""
+        speed = np.sqrt(self.vx[slots] ** 2 + self.vy[slots] ** 2).max()
+        n = max(2, math.ceil(2 * spread * speed / spacing) + 1)
+        f = np.clip(np.asarray(flight, np.float64)[:, None] + np.linspace(-spread, spread, n)[None, :], 0, None)
+        return (self.x0[slots][:, None] + self.vx[slots][:, None] * f,
+                self.y0[slots][:, None] + self.vy[slots][:, None] * f)
@@ -0,0 +1,145 @@
+import struct
+import time
+import zlib
+
+# --- ЧТЕНИЕ КАДРОВ БЕЗ ЛИШНИХ КОПИЙ ---
+# Кадр = 4 байта длины (big-endian) + тело. Сокет пишет прямо в свободный
+# хвост одного растущего bytearray (recv_into), кадры отдаются срезами
+# memoryview по этому же буферу. Недочитанный заголовок или тело просто
+# ждут следующего recv. Общий для сервера (asyncio.BufferedProtocol)
+# и клиента (поток приема).
+#
+# Старший бит длины - тело сжато zlib. Контекст один на все соединение,
+# поэтому похожие друг на друга снапшоты жмутся лучше. Сжатие клиент
+# предлагает в INIT, кадры меньше порога идут как есть.
+
+LENGTH = struct.Struct('>I')
+FLAG_COMPRESSED = 0x80000000
+MIN_READ = 16 * 1024           # свободного места под один recv
+MAX_FRAME = 16 * 1024 * 1024   # больше - битый поток
+COMPRESS_THRESHOLD = 512       # кадры меньше - без сжатия
+COMPRESS_LEVEL = 1             # быстрый уровень: нам важнее CPU тика, чем последние байты
+
+
+class FrameError(ValueError):
+    pass
+
+
+def _ratio(stats):
+    return stats["packed"] / stats["raw"] if stats["raw"] else 1.0
+
+
+class FrameCompressor:
+    """Исходящие кадры одного соединения: сжимает большие, маленькие пропускает.
+    Контекст zlib один на поток - кадры надо отправлять в порядке сжатия"""
+
+    def __init__(self, threshold=COMPRESS_THRESHOLD, level=COMPRESS_LEVEL):
+        self.threshold = threshold
+        self._zc = zlib.compressobj(level)
+        self.stats = {"frames": 0, "bypass": 0, "raw": 0, "packed": 0, "cpu_ms": 0.0}
+
+    def pack(self, payload):
+        """Заголовок + тело, готовые к записи в сокет"""
+        if len(payload) < self.threshold:
+            self.stats["bypass"] += 1
+            return LENGTH.pack(len(payload)) + payload
+        started = time.perf_counter()
+        body = self._zc.compress(payload) + self._zc.flush(zlib.Z_SYNC_FLUSH)
+        self.stats["cpu_ms"] += (time.perf_counter() - started) * 1000
+        self.stats["frames"] += 1
+        self.stats["raw"] += len(payload)
+        self.stats["packed"] += len(body)
+        return LENGTH.pack(len(body) | FLAG_COMPRESSED) + body
+
+    @property
+    def ratio(self):
+        return _ratio(self.stats)
+
+
+def pack_frame(payload):
+    return LENGTH.pack(len(payload)) + payload
+
+
+class FrameReader:
+    """Буфер приема одного соединения. Кадр от next_frame() - memoryview,
+    действительный до следующего чтения в буфер (потом место переиспользуется)"""
+
+    def __init__(self, initial_size=64 * 1024, max_frame=MAX_FRAME):
+        self.max_frame = max_frame
+        self.buf = bytearray(initial_size)
+        self.view = memoryview(self.buf)
+        self.start = 0  # начало непрочитанных данных
+        self.end = 0    # конец полученных данных
+        self.last_size = 0  # байт последнего кадра на проводе (с заголовком)
+        self._zd = zlib.decompressobj()
+        self.stats = {"frames": 0, "raw": 0, "packed": 0, "cpu_ms": 0.0}
+
+    def _missing(self):
+        """Сколько байт не хватает до конца текущего кадра (если заголовок уже есть)"""
+        avail = self.end - self.start
+        if avail < LENGTH.size: return LENGTH.size - avail
+        (size,) = LENGTH.unpack_from(self.buf, self.start)
+        return max(0, LENGTH.size + (size & ~FLAG_COMPRESSED) - avail)
+
+    def get_buffer(self, size_hint=-1):
+        """Свободный хвост буфера под recv_into (сдвигает или растит буфер при нехватке)"""
+        need = max(size_hint, MIN_READ, self._missing())
+        if len(self.buf) - self.end < need:
+            avail = self.end - self.start
+            if self.start:
+                # Сдвигаем недочитанное в начало (memoryview копирует через memmove)
+                self.view[:avail] = self.view[self.start:self.end]
+                self.start, self.end = 0, avail
+            if len(self.buf) - self.end < need:
+                new_buf = bytearray(max(len(self.buf) * 2, self.end + need))
+                new_buf[:avail] = self.view[:avail]
+                self.buf = new_buf
+                self.view = memoryview(new_buf)
+        return self.view[self.end:]
+
+    def advance(self, nbytes):
+        """В хвост get_buffer() записано nbytes байт"""
+        self.end += nbytes
+
+    def recv_into(self, sock):
+        """Один recv из блокирующего сокета. 0 - соединение закрыто"""
+        nbytes = sock.recv_into(self.get_buffer())
+        self.end += nbytes
+        return nbytes
+
+    def next_frame(self):
+        """Тело следующего полного кадра или None (сжатое - уже распакованным bytes)"""
+        avail = self.end - self.start
+        if avail < LENGTH.size:
+            if not avail: self.start = self.end = 0
+            return None
+        (size,) = LENGTH.unpack_from(self.buf, self.start)
+        compressed = size & FLAG_COMPRESSED
+        size &= ~FLAG_COMPRESSED
+        if size > self.max_frame:
+            raise FrameError(f"Слишком большой кадр: {size} байт")
+        if avail < LENGTH.size + size: return None
+        body_start = self.start + LENGTH.size
+        self.start = body_start + size
+        self.last_size = LENGTH.size + size
+        body = self.view[body_start:self.start]
+        if compressed: body = self._inflate(body)
+        return body
+
+    def _inflate(self, body):
+        started = time.perf_counter()
+        try:
+            data = self._zd.decompress(body, self.max_frame)
+        except zlib.error as e:
+            raise FrameError(f"Битый сжатый кадр: {e}") from e
+        if self._zd.unconsumed_tail:
+            raise FrameError("Слишком большой сжатый кадр")
+        self.stats["cpu_ms"] += (time.perf_counter() - started) * 1000
+        self.stats["frames"] += 1
+        self.stats["raw"] += len(data)
+        self.stats["packed"] += len(body)
+        return data
+
+    @property
+    def ratio(self):
+        return _ratio(self.stats)
@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import deque
+
+# --- ИНТЕРПОЛЯЦИЯ ЧУЖИХ ИГРОКОВ ---
+# Чужих игроков рисуем не по последнему снапшоту, а чуть в прошлом
+# (INTERP_DELAY): между двумя соседними снапшотами по времени сервера
+# позиция интерполируется линейно. Снапшот опоздал - немного
+# экстраполируем по скорости, но не дальше MAX_EXTRAPOLATION.
+# Время сервера - номер тика / частота тика (приходит в WELCOME).
+# Пули сюда не входят - их ведет projectiles.py по событиям в том же времени.
+
+INTERP_DELAY = 0.1        # сек; не меньше двух тиков сервера
+MAX_EXTRAPOLATION = 0.1   # сек
+HISTORY_SIZE = 32         # снапшотов на сущность
+
+
+class InterpolationBuffer:
+    """Последние снапшоты каждой сущности со временем сервера.
+    Пишет поток приема, читает цикл кадра - поэтому под замком"""
+
+    def __init__(self, tick_rate=30, delay=INTERP_DELAY, max_extrapolation=MAX_EXTRAPOLATION,
+                 history_size=HISTORY_SIZE):
+        self.lock = threading.Lock()
+        self.max_extrapolation = max_extrapolation
+        self.history_size = history_size
+        self.entities = {}  # id -> deque((t, x, y))
+        self.last_t = None
+        self.offset = None  # локальное время минус время сервера
+        self.set_tick_rate(tick_rate, delay)
+
+    def set_tick_rate(self, tick_rate, delay=INTERP_DELAY):
+        self.tick_rate = tick_rate
+        self.delay = max(delay, 2.0 / tick_rate)
+
+    def add(self, snap, recv_time=None):
+        if recv_time is None: recv_time = time.perf_counter()
+        t = snap.tick / self.tick_rate
+        with self.lock:
+            # По UDP снапшоты приходят не по порядку - старые не нужны
+            if self.last_t is not None and t <= self.last_t: return
+            self.last_t = t
+            # Смещение часов: быстро вниз (пакет дошел быстрее), медленно вверх
+            sample = recv_time - t
+            if self.offset is None or sample < self.offset: self.offset = sample
+            else: self.offset += (sample - self.offset) * 0.01
+
+            for p_id, st in snap.players.items():
+                if not st.in_view:
+                    self.entities.pop(p_id, None)
+                    continue
+                hist = self.entities.get(p_id)
+                if hist is None: hist = self.entities[p_id] = deque(maxlen=self.history_size)
+                hist.append((t, st.x, st.y))
+            for p_id in [p_id for p_id in self.entities if p_id not in snap.players]:
+                del self.entities[p_id]
+
+    def render_time(self, now=None):
+        """Момент времени сервера, который сейчас показываем"""
+        if self.offset is None: return None
+        if now is None: now = time.perf_counter()
+        return now - self.offset - self.delay
+
+    def sample(self, p_id, t):
+        """(x, y) сущности в момент t или None, если истории нет"""
+        with self.lock:
+            hist = self.entities.get(p_id)
+            if not hist: return None
+            hist = list(hist)
+        if t <= hist[0][0]:
+            return hist[0][1:]
+
+        # Внутри истории - интерполяция между соседними снапшотами
+        for i in range(len(hist) - 1, 0, -1):
+            t0, x0, y0 = hist[i - 1]
+            t1, x1, y1 = hist[i]
+            if t0 <= t <= t1:
+                k = (t - t0) / (t1 - t0)
+                return x0 + (x1 - x0) * k, y0 + (y1 - y0) * k
+
+        # Новее последнего снапшота - экстраполяция с ограничением
+        t1, x1, y1 = hist[-1]
+        if len(hist) < 2: return x1, y1
+        t0, x0, y0 = hist[-2]
+        k = min(t - t1, self.max_extrapolation) / (t1 - t0)
+        return x1 + (x1 - x0) * k, y1 + (y1 - y0) * k
@@ -8,7 +8,10 @@ import os
 import time
 import threading 
 from network import Network, LANScanner 
-import server
+from player import Player, Wall, draw_bullet
+import protocol
+from prediction import InputBuffer
+from projectiles import BulletTracks
 # import pygame.freetype 
 from UI import *
 
@@ -429,11 +432,53 @@ def main_menu():
                         if active_input == "IP" and len(user_ip) < 15: user_ip += event.unicode
 
 
+def apply_snapshot(snap, p, all_players, walls, chat_messages, inputs, tick_rate):
+    """Переносит легкие записи снапшота в объекты для отрисовки.
+    inputs - буфер наших команд: позиция сервера сверяется с предсказанной"""
+    for pid, st in snap.players.items():
+        if pid not in all_players:
+            all_players[pid] = Player(st.x, st.y, p.width, p.height, (255, 255, 255), pid)
+        all_players[pid].apply_state(st)
+    for pid in list(all_players):
+        if pid not in snap.players: del all_players[pid]
+
+    for wid, st in snap.walls.items():
+        if wid not in walls: walls[wid] = Wall.from_state(st, snap.tick, tick_rate)
+    for wid in list(walls):
+        if wid not in snap.walls: del walls[wid]
+
+    if snap.chat:
+        chat_messages.extend(snap.chat)
+        del chat_messages[:-20]
+
+    srv_p = snap.players.get(p.id)
+    if srv_p is not None and srv_p.in_view:
+        p.hp = srv_p.hp
+        p.kills = srv_p.kills
+        p.deaths = srv_p.deaths
+        inputs.reconcile(p, srv_p.x, srv_p.y, snap.client_seq, MAP_WIDTH, MAP_HEIGHT)
+        p.abilities["shield"].cooldown = srv_p.shield_cooldown
+        p.abilities["shield"].duration = srv_p.shield_duration
+        p.abilities["wall"].cooldown = srv_p.wall_cooldown
+        p.abilities["wall"].duration = srv_p.wall_duration
+
+def interpolate_players(interp, all_players, my_id):
+    """Чужие игроки - в момент чуть в прошлом, между снапшотами"""
+    t = interp.render_time()
+    if t is None: return
+    for pid, op in all_players.items():
+        if pid == my_id or not op.in_view: continue
+        state = interp.sample(pid, t)
+        if state is None: continue
+        op.x, op.y = state
+        op.update_rect()
+
 def game_loop(server_ip, nickname, selected_skin, is_local_host):
     global WIDTH, HEIGHT
     # Запуск сервера
     server_thread = None
     if is_local_host:
+        import server # только хосту: серверу нужен NumPy, клиенту - нет
         server_thread = threading.Thread(target=server.start_server_instance, args=("127.0.0.1",))
         server_thread.daemon = True
         server_thread.start()
@@ -449,7 +494,9 @@ def game_loop(server_ip, nickname, selected_skin, is_local_host):
     
     p.nickname = nickname
     p.skin_id = selected_skin 
-    n.send({"type": "INIT", "skin": selected_skin, "nick": nickname, "player": p})
+    n.send({"type": "INIT", "skin": selected_skin, "nick": nickname})
+    # Дальше сеть работает в фоне: цикл кадра не ждет ответа сервера
+    n.start_pipeline()
     
     clock = pygame.time.Clock()
     run = True
@@ -460,6 +507,8 @@ def game_loop(server_ip, nickname, selected_skin, is_local_host):
     
     last_walls = {}
     all_players = {}
+    inputs = InputBuffer() # неподтвержденные сервером команды (предсказание)
+    remote_bullets = BulletTracks(skip_owner=p.id) # чужие пули по событиям сервера
     chat_messages = []
     
     typing_mode = False
@@ -493,7 +542,8 @@ def game_loop(server_ip, nickname, selected_skin, is_local_host):
             displayed_hp = max(p.hp, displayed_hp)
 
         msg_to_send = None
-        ability_to_cast = None
+        buttons = 0       # кнопки команды ввода (выстрел, способности)
+        fire_at = None    # экранная точка выстрела в этом кадре
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT: run = False
@@ -522,12 +572,12 @@ def game_loop(server_ip, nickname, selected_skin, is_local_host):
                 # Способности (если не джойстик)
                 if not touch_ctrl.joy_active:
                     if touch_ctrl.btn_ability1.collidepoint(tx, ty):
-                        if p.cast_ability("shield"): ability_to_cast = {"key": "shield"}
+                        if p.cast_ability("shield"): buttons |= protocol.BTN_SHIELD
                     elif touch_ctrl.btn_ability2.collidepoint(tx, ty):
-                        if p.cast_ability("wall"): ability_to_cast = {"key": "wall"}
+                        if p.cast_ability("wall"): buttons |= protocol.BTN_WALL
                     # Стрельба
                     elif tx > WIDTH // 2:
-                        p.shoot(tx, ty, scroll)
+                        fire_at = (tx, ty)
                         shoot_flash = 5; flash_pos = (tx, ty)
 
             # 3. Обработка ДВИЖЕНИЯ (Motion)
@@ -570,27 +620,29 @@ def game_loop(server_ip, nickname, selected_skin, is_local_host):
                     if event.key == pygame.K_BACKSPACE: current_message = current_message[:-1]
                     elif len(current_message) < 40: current_message += event.unicode
                 elif not typing_mode:
-                    if event.key == pygame.K_1 and p.cast_ability("shield"): ability_to_cast = {"key": "shield"}
-                    if event.key == pygame.K_2 and p.cast_ability("wall"): ability_to_cast = {"key": "wall"}
+                    if event.key == pygame.K_1 and p.cast_ability("shield"): buttons |= protocol.BTN_SHIELD
+                    if event.key == pygame.K_2 and p.cast_ability("wall"): buttons |= protocol.BTN_WALL
 
             if event.type == pygame.MOUSEBUTTONDOWN and not typing_mode:
                 if event.button == 1:
                     mx, my = pygame.mouse.get_pos()
-                    p.shoot(mx, my, scroll)
+                    fire_at = (mx, my)
                     shoot_flash = 5; flash_pos = (mx, my)
 
-        # if not typing_mode and p.hp > 0: p.move(MAP_WIDTH, MAP_HEIGHT)
-        if p.hp > 0:
-            if not typing_mode:
-                jx, jy = touch_ctrl.get_movement()
-                if jx != 0 or jy != 0:
-                    p.x += jx * p.vel
-                    p.y += jy * p.vel
-                # Если не печатаем -> слушаем WASD и обновляем пули
-                p.move(MAP_WIDTH, MAP_HEIGHT)
-            else:
-                # Если печатаем -> ТОЛЬКО обновляем пули (инерцию)
-                p.update(MAP_WIDTH, MAP_HEIGHT)
+        # Команда ввода кадра: ее же применяем у себя и шлем серверу
+        move_x, move_y = 0, 0
+        if not typing_mode:
+            # Если не печатаем -> джойстик + WASD (если печатаем - только пули летят)
+            keys = pygame.key.get_pressed()
+            jx, jy = touch_ctrl.get_movement()
+            move_x = max(-1, min(1, jx + keys[pygame.K_d] - keys[pygame.K_a]))
+            move_y = max(-1, min(1, jy + keys[pygame.K_s] - keys[pygame.K_w]))
+        aim = 0.0
+        if fire_at:
+            buttons |= protocol.BTN_FIRE
+            aim = p.aim_angle(fire_at[0], fire_at[1], scroll)
+        cmd = protocol.InputCommand.build(move_x, move_y, aim, buttons)
+        if p.hp > 0: p.apply_input(cmd, MAP_WIDTH, MAP_HEIGHT)
         
         # Сеть
         hit_data = []
@@ -601,38 +653,34 @@ def game_loop(server_ip, nickname, selected_skin, is_local_host):
                 if br.colliderect(w.rect): hit = True; break
             if hit: p.deleteBullet(bullet); continue
             for pid, op in all_players.items():
-                if pid != p.id and op.hp > 0 and op.abilities["shield"].duration <= 0:
+                if pid != p.id and op.in_view and op.hp > 0 and op.abilities["shield"].duration <= 0:
                     if br.colliderect(op.rect):
                         p.deleteBullet(bullet); hit_data.append({"target_id": pid, "damage": 10})
                         break
         
-        # packet = {"type": "UPDATE", "player": p}
-        # Отправляем пинг в пакете
-        current_ping = int(n.latency)
-        packet = {"type": "UPDATE", "player": p, "ping": current_ping}
-        if hit_data: packet["hits"] = hit_data
-        if msg_to_send: packet["msg"] = msg_to_send
-        if ability_to_cast: packet["ability_cast"] = ability_to_cast
-
-        server_data = n.send(packet)
-        if server_data == "NETWORK_FAILURE" or server_data == None: n.disconnect(); run = False; break
-            
-        all_players = server_data.get("players", {})
-        last_walls = server_data.get("walls", {})
-        if "chat" in server_data:
-            chat_messages.extend(server_data["chat"])
-            if len(chat_messages) > 20: chat_messages = chat_messages[-20:]
-        
-        if p.id in all_players:
-            srv_p = all_players[p.id]
-            p.hp = srv_p.hp
-            p.kills = srv_p.kills
-            p.deaths = srv_p.deaths
-            p.setPose(srv_p.x, srv_p.y)
-            for k, ab in srv_p.abilities.items():
-                if k in p.abilities:
-                    p.abilities[k].cooldown = ab.cooldown
-                    p.abilities[k].duration = ab.duration
+        # Вместо всего Player - команда ввода (пинг едет в ее заголовке) и события
+        events = {}
+        if hit_data: events["hits"] = hit_data
+        if msg_to_send: events["msg"] = msg_to_send
+
+        n.post_input(cmd, events)
+        inputs.push(cmd)
+        if not n.connected: n.disconnect(); run = False; break
+
+        # None - новый снапшот еще не пришел, рисуем по прошлому
+        server_data = n.poll()
+        if server_data is not None:
+            apply_snapshot(server_data, p, all_players, last_walls, chat_messages, inputs, n.interp.tick_rate)
+            remote_bullets.apply(server_data.events, n.interp.tick_rate)
+        # Каждый кадр, а не только по снапшоту: так движение плавное при любой частоте тика
+        interpolate_players(n.interp, all_players, p.id)
+        # Стены истекают по своему сроку, сервер об этом не пишет
+        for wid in [wid for wid, w in last_walls.items() if w.time_left() <= 0]:
+            del last_walls[wid]
+        # Свои пули - предсказанные, чужие - по времени интерполяции
+        if p.id in all_players: all_players[p.id].bullets = p.bullets
+        render_t = n.interp.render_time()
+        bullets_to_draw = remote_bullets.at(render_t, MAP_WIDTH, MAP_HEIGHT) if render_t is not None else []
 
         # --- ОТРИСОВКА ---
         win.fill(C_BG_DEEP)
@@ -648,6 +696,7 @@ def game_loop(server_ip, nickname, selected_skin, is_local_host):
             win.blit(s, (screen_x-10, screen_y-10))
 
         for p_id, player in all_players.items():
+            if not player.in_view: continue
             skin_props = SKINS_DATA.get(player.skin_id, SKINS_DATA["DEFAULT"])
             player.color = skin_props.get("body_color", (255, 255, 255))
             player.trail_color = skin_props.get("trail_color", player.color)
@@ -662,6 +711,9 @@ def game_loop(server_ip, nickname, selected_skin, is_local_host):
                 display_name = getattr(player, 'nickname', f"Игрок {p_id}")
                 draw_text_freetype(FONT_UI, display_name, (200, 200, 200), screen_px, screen_py - 20, center=True, win=win)
 
+        for bx, by, bvx, bvy in bullets_to_draw:
+            draw_bullet(win, bx, by, bvx, bvy, scroll)
+
         if shoot_flash > 0:
             shoot_flash -= 1
             s = pygame.Surface((60, 60), pygame.SRCALPHA)
@@ -704,7 +756,7 @@ def game_loop(server_ip, nickname, selected_skin, is_local_host):
             pygame.draw.rect(win, C_NEON_CYAN, (10, HEIGHT-80, 300, 30), 2)
             FONT_SMALL.render_to(win, (15, HEIGHT-75), current_message + "_", C_NEON_CYAN)
             
-        debug_ui.draw(win, p, all_players, int(clock.get_fps()), n)
+        debug_ui.draw(win, p, all_players, int(clock.get_fps()), n, inputs)
         
         keys = pygame.key.get_pressed()
         if keys[pygame.K_TAB]:
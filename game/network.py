@@ -2,13 +2,27 @@ import socket
 import pickle
 import struct
 import time
+import threading
+import queue
+from collections import deque
+import protocol
+import reliable
+from interpolation import InterpolationBuffer
+from framing import FrameReader, FrameError
 
 # Порт для поиска серверов (UDP)
 BROADCAST_PORT = 5556
 MAGIC_MESSAGE = b"NEON_DISCOVERY"
 
+# Живость соединения: в простое (нет ввода) клиент шлет пустой пакет ввода,
+# иначе сервер сочтет его пропавшим. От сервера снапшоты идут каждый тик -
+# тишина дольше SERVER_TIMEOUT по всем каналам значит, что сервера нет
+HEARTBEAT_INTERVAL = 1.0
+SERVER_TIMEOUT = 10.0
+IO_TIMEOUT = 5.0  # одна операция с TCP-сокетом (запись в том числе)
+
 class Network:
-    def __init__(self, server_ip):
+    def __init__(self, server_ip, use_udp=True, compress=True, rate=None):
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server = server_ip
         self.port = 5555
@@ -34,6 +48,42 @@ class Network:
         self._temp_recv = 0
         self._temp_packets_sent = 0
         self._temp_packets_recv = 0
+
+        # Базовые снапшоты для дельт и номер последнего полученного (ack)
+        self.decoder = protocol.SnapshotDecoder()
+        self._decode_lock = threading.Lock() # Снапшоты приходят и по TCP, и по UDP
+        self.reader = FrameReader()          # буфер приема TCP-кадров (recv_into)
+        self.compress = compress             # предложить серверу zlib в INIT
+        self.rate = rate                     # байт/с снапшотов, если канал слабый (None - как решит сервер)
+
+        # Номер исходящего пакета и время отправки - для пинга по seq
+        self.seq = 0
+        self._sent_times = {}
+        self._recent_inputs = deque(maxlen=protocol.INPUT_REDUNDANCY)
+        self.last_tick = 0  # тик сервера из последнего снапшота
+        self.last_recv = time.perf_counter()  # когда что-то пришло от сервера (TCP или UDP)
+
+        # --- PIPELINE (фоновые потоки приема/отправки) ---
+        self.connected = False
+        self.pipelined = False
+        self._send_queue = queue.Queue()
+        self._state_lock = threading.Lock()
+        self._latest = None        # Последний снапшот, еще не забранный poll()
+        self._latest_seq = 0
+        self._pending_chat = []    # Чат из всех снапшотов с прошлого poll()
+        self._pending_events = []  # События пуль оттуда же, без повторов
+        self._event_seq = 0        # seq последнего принятого события
+        # Снапшоты по времени сервера - для плавной отрисовки чужих игроков
+        self.interp = InterpolationBuffer()
+
+        # --- UDP (сервер присылает токен в WELCOME, TCP остается запасным) ---
+        self.use_udp = use_udp
+        self.udp_token = None
+        self.udp_port = None
+        self.udp_ready = False
+        self.udp_sock = None
+        self.channel = None
+        self._udp_lock = threading.Lock()
         
         self.p = self.connect()
 
@@ -46,12 +96,24 @@ class Network:
             self.client.connect(self.addr)
             raw_data = self.client.recv(8192) # Увеличил буфер инициализации
             self.traffic_stats["recv_total"] += len(raw_data)
+            self.connected = True
             return pickle.loads(raw_data)
         except Exception as e:
             print(f"Connection failed: {e}")
             self.disconnect()
             return None
 
+    def disconnect(self):
+        self.connected = False
+        self.udp_ready = False
+        self._send_queue.put(None) # Будим поток отправки
+        try:
+            self.client.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.client.close()
+        if self.udp_sock: self.udp_sock.close()
+
     def _update_rates(self):
         """Обновляет показатели скорости раз в секунду"""
         now = time.time()
@@ -63,55 +125,268 @@ class Network:
             self._temp_recv = 0
             self.last_time_check = now
 
+    def _count_sent(self, size):
+        self.traffic_stats["sent_total"] += size
+        self.traffic_stats["packets_sent"] += 1
+        self.traffic_stats["last_packet_size_sent"] = size
+        self._temp_sent += size
+
+    def _count_recv(self, size):
+        self.traffic_stats["recv_total"] += size
+        self.traffic_stats["packets_recv"] += 1
+        self.traffic_stats["last_packet_size_recv"] = size
+        self._temp_recv += size
+        self.last_recv = time.perf_counter()
+        self._update_rates()
+
+    def _pack(self, data):
+        """Сериализует служебный пакет (INIT, события) и добавляет 4 байта длины.
+        seq получает только INIT - остальные seq у команд ввода"""
+        seq = None
+        if isinstance(data, dict) and data.get("type") == "INIT":
+            self.seq += 1
+            seq = data["seq"] = self.seq
+            data["ack"] = self.decoder.latest
+            if self.use_udp: data["udp"] = True
+            if self.compress: data["zlib"] = True
+            if self.rate: data["rate"] = int(self.rate)
+        serialized_data = pickle.dumps(data)
+        return seq, struct.pack('>I', len(serialized_data)) + serialized_data
+
+    def _mark_sent(self, seq):
+        # Время отправки запоминаем по seq - снапшот сервера вернет его обратно
+        if seq is None: return
+        with self._state_lock:
+            self._sent_times[seq] = time.perf_counter()
+            if len(self._sent_times) > 256:
+                for old in sorted(self._sent_times)[:128]: del self._sent_times[old]
+
+    def _send_frame(self, seq, frame):
+        self._mark_sent(seq)
+        self.client.sendall(frame)
+        self._count_sent(len(frame) - 4)
+
+    def _send_datagram(self, seq, payload):
+        self._mark_sent(seq)
+        with self._udp_lock:
+            datagram = self.channel.build(reliable.KIND_INPUT, payload)
+        self.udp_sock.send(datagram)
+        self._count_sent(len(datagram))
+
+    def _recv_frame(self):
+        """Тело следующего кадра (memoryview в буфере приема - до следующего чтения)"""
+        while True:
+            frame = self.reader.next_frame()
+            if frame is not None: return frame
+            if not self.reader.recv_into(self.client):
+                raise RuntimeError("Соединение разорвано")
+
+    def _recv_snapshot(self):
+        """Принимает кадры с длиной до первого снапшота (WELCOME запоминает по пути)"""
+        while True:
+            full_data = self._recv_frame()
+            self._count_recv(self.reader.last_size)
+
+            if protocol.frame_type(full_data) == protocol.MSG_WELCOME:
+                self.udp_token, self.udp_port, tick_rate = protocol.decode_welcome(full_data)
+                self.interp.set_tick_rate(tick_rate)
+                continue
+            return self._handle_snapshot(full_data)
+
+    def _handle_snapshot(self, data):
+        """Декодирует дельту и меряет пинг по seq"""
+        with self._decode_lock:
+            snap = self.decoder.decode(data)
+            if snap.tick > self.last_tick: self.last_tick = snap.tick
+
+        # Пинг: сервер возвращает seq последнего обработанного пакета
+        # и сколько он ждал тика (это не сетевая задержка)
+        with self._state_lock:
+            sent_at = self._sent_times.pop(snap.client_seq, None)
+        if sent_at is not None:
+            self.latency = max(0, (time.perf_counter() - sent_at) * 1000 - snap.client_hold)
+        return snap
+
     def send(self, data):
+        """Блокирующий режим: отправить и дождаться ответа"""
         try:
-            start_time = time.perf_counter()
-            
             # 1. Подготовка и отправка данных с заголовком
-            serialized_data = pickle.dumps(data)
-            data_size = len(serialized_data)
-            length_prefix = struct.pack('>I', data_size) # 4 байта длины
-            
-            self.client.sendall(length_prefix + serialized_data)
-            
-            # Обновление статистики отправки
-            self.traffic_stats["sent_total"] += data_size
-            self.traffic_stats["packets_sent"] += 1
-            self._temp_sent += data_size
-
-            # 2. Получение ответа: сначала читаем 4 байта длины
-            header = self.client.recv(4)
-            if not header or len(header) < 4:
-                return None
-            
-            msg_len = struct.unpack('>I', header)[0]
-            
-            # 3. Читаем тело сообщения целиком (в цикле)
-            chunks = []
-            bytes_recd = 0
-            while bytes_recd < msg_len:
-                # Читаем остаток данных
-                chunk = self.client.recv(min(msg_len - bytes_recd, 4096 * 32))
-                if not chunk:
-                    raise RuntimeError("Соединение разорвано")
-                chunks.append(chunk)
-                bytes_recd += len(chunk)
-            
-            full_data = b''.join(chunks)
-            
-            # Статистика приема и пинг
-            end_time = time.perf_counter()
-            self.latency = (end_time - start_time) * 1000
-            self.traffic_stats["recv_total"] += len(full_data)
-            self.traffic_stats["packets_recv"] += 1
-            self._temp_recv += len(full_data)
-            self._update_rates()
-
-            return pickle.loads(full_data)
+            self._send_frame(*self._pack(data))
+
+            # 2. Ответ сервера - бинарный снапшот (см. protocol.py). Он же первый
+            # для poll(): следующие дельты строятся к нему, а в нем - чат и пули,
+            # которые уже летят (события с EventLog.join_seq)
+            snap = self._recv_snapshot()
+            self._publish(snap)
+            return snap
             
-        except (socket.error, pickle.UnpicklingError) as e:
+        except (socket.error, RuntimeError, protocol.ProtocolError, FrameError) as e:
             print(f"Network error: {e}")
             return None
+
+    # --- PIPELINED MODE ---
+    # Цикл отрисовки только кладет пакеты в очередь (post) и забирает
+    # последний готовый снапшот (poll), никогда не ожидая сокет.
+
+    def start_pipeline(self):
+        if self.pipelined or not self.connected: return
+        self.pipelined = True
+        self.client.settimeout(IO_TIMEOUT)
+        threading.Thread(target=self._sender_loop, daemon=True).start()
+        threading.Thread(target=self._receiver_loop, daemon=True).start()
+        if self.use_udp and self.udp_token:
+            threading.Thread(target=self._udp_loop, daemon=True).start()
+
+    def post_input(self, cmd, events=None):
+        """Команда ввода кадра (protocol.InputCommand) и события (msg, hits).
+        Ставит seq и тик, кладет в очередь отправки и возвращается не дожидаясь сокета"""
+        if not self.connected: return
+        self.seq += 1
+        cmd.seq = self.seq
+        cmd.tick = self.last_tick
+        self._recent_inputs.append(cmd)
+        if self.udp_ready:
+            # События - надежно по UDP, ввод - ненадежно с повтором последних команд
+            if events:
+                try:
+                    with self._udp_lock:
+                        self.channel.queue(pickle.dumps(events))
+                except reliable.ChannelError as e:
+                    print(f"Network error: {e}")
+                    self.connected = False
+                    return
+            payload = protocol.encode_input(self._recent_inputs, self.decoder.latest, self.latency)
+            self._send_queue.put(("udp", cmd.seq, payload))
+            return
+        if events:
+            self._send_queue.put(("tcp", None, self._pack(dict(events, type="EVENTS"))[1]))
+        payload = protocol.encode_input((cmd,), self.decoder.latest, self.latency)
+        self._send_queue.put(("tcp", cmd.seq, struct.pack('>I', len(payload)) + payload))
+
+    def poll(self):
+        """Последний полученный снапшот (или None, если нового нет).
+        Чат и события пуль собираются со всех снапшотов, пришедших с прошлого вызова."""
+        with self._state_lock:
+            snap = self._latest
+            if snap is None: return None
+            self._latest = None
+            result = protocol.Snapshot(snap.seq)
+            result.tick = snap.tick
+            result.client_seq = snap.client_seq
+            result.client_hold = snap.client_hold
+            result.players = snap.players
+            result.walls = snap.walls
+            result.chat = self._pending_chat
+            self._pending_chat = []
+            result.events = self._pending_events
+            self._pending_events = []
+        return result
+
+    def _publish(self, snap):
+        # В буфер интерполяции - каждый снапшот, даже если poll() его не увидит
+        self.interp.add(snap)
+        with self._state_lock:
+            self._pending_chat.extend(snap.chat)
+            # Неподтвержденные события сервер повторяет в каждом снапшоте
+            for ev in snap.events:
+                if ev.seq > self._event_seq:
+                    self._pending_events.append(ev)
+                    self._event_seq = ev.seq
+            # По UDP снапшоты могут прийти не по порядку - старые не показываем
+            if snap.seq > self._latest_seq:
+                self._latest = snap
+                self._latest_seq = snap.seq
+
+    def _heartbeat(self):
+        """Пустой пакет ввода: сервер видит, что мы живы, и получает ack"""
+        payload = protocol.encode_input((), self.decoder.latest, self.latency)
+        return ("tcp", None, struct.pack('>I', len(payload)) + payload)
+
+    def _sender_loop(self):
+        while self.connected:
+            try:
+                item = self._send_queue.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                item = self._heartbeat()
+            if item is None or not self.connected: break
+            channel, seq, data = item
+            try:
+                if channel == "udp": self._send_datagram(seq, data)
+                else: self._send_frame(seq, data)
+            except OSError as e:
+                if self.connected: print(f"Network error: {e}")
+                self.connected = False
+                break
+
+    def _receiver_loop(self):
+        while self.connected:
+            try:
+                snap = self._recv_snapshot()
+            except socket.timeout:
+                # По TCP может быть тихо, если снапшоты идут по UDP
+                if time.perf_counter() - self.last_recv < SERVER_TIMEOUT: continue
+                if self.connected: print("Network error: сервер не отвечает")
+                self.connected = False
+                break
+            except (OSError, RuntimeError, protocol.ProtocolError, FrameError) as e:
+                if self.connected: print(f"Network error: {e}")
+                self.connected = False
+                break
+            self._publish(snap)
+
+    def _udp_loop(self):
+        """Рукопожатие по токену, затем прием снапшотов и событий по UDP"""
+        try:
+            self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_sock.connect((self.server, self.udp_port))
+            self.udp_sock.settimeout(0.2)
+        except OSError as e:
+            print(f"UDP недоступен, остаемся на TCP: {e}")
+            return
+        self.channel = reliable.ReliableChannel(self.udp_token)
+
+        # 1. HELLO, пока сервер не ответит (иначе работаем только по TCP)
+        for _ in range(10):
+            if not self.connected: return
+            try:
+                with self._udp_lock:
+                    hello = self.channel.build(reliable.KIND_HELLO)
+                self.udp_sock.send(hello)
+                data = self.udp_sock.recv(65536)
+                with self._udp_lock:
+                    kind, _, _, _ = self.channel.receive(data)
+                if kind == reliable.KIND_HELLO:
+                    self.udp_ready = True
+                    break
+            except socket.timeout:
+                continue
+            except (OSError, reliable.ChannelError) as e:
+                print(f"UDP недоступен, остаемся на TCP: {e}")
+                return
+        if not self.udp_ready:
+            print("UDP не ответил, остаемся на TCP")
+            return
+
+        # 2. Прием
+        while self.connected:
+            try:
+                data = self.udp_sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                with self._udp_lock:
+                    kind, payload, messages, stale = self.channel.receive(data)
+                self._count_recv(len(data))
+                if messages:
+                    # От сервера надежно приходит чат
+                    with self._state_lock:
+                        self._pending_chat.extend(m.decode('utf-8', 'replace') for m in messages)
+                if kind == reliable.KIND_SNAPSHOT and payload:
+                    self._publish(self._handle_snapshot(payload))
+            except (reliable.ChannelError, protocol.ProtocolError) as e:
+                print(f"UDP: {e}")
             
 class LANScanner:
     @staticmethod
@@ -0,0 +1,51 @@
+import math
+import numpy as np
+
+# --- ВОСПРИЯТИЕ БОТОВ ---
+# Раз за тик и сразу для всех ботов: ближайший живой игрок в радиусе обзора.
+# Матрица расстояний "боты x живые игроки" считается векторно, каждый бот
+# потом только читает свой результат (Bot.ai_move, seen=...), а не обходит
+# всех игроков сам. Расстояния - между центрами, как в Bot.find_target,
+# при равных побеждает игрок раньше по порядку.
+
+
+def centers(entities):
+    xs = np.array([e.x + e.width // 2 for e in entities], np.float64)
+    ys = np.array([e.y + e.height // 2 for e in entities], np.float64)
+    return xs, ys
+
+
+def _distances2(seekers, others):
+    """Матрица квадратов расстояний между центрами: seekers x others"""
+    sx, sy = centers(seekers)
+    ox, oy = centers(others)
+    d2 = np.subtract.outer(sx, ox)
+    d2 *= d2
+    dy = np.subtract.outer(sy, oy)
+    dy *= dy
+    d2 += dy
+    return d2
+
+
+def nearest_targets(seekers, players):
+    """seekers - боты, players - все игроки по порядку.
+    -> {id бота: (ближайший живой игрок в его view_radius или None, расстояние)}"""
+    if not seekers: return {}
+    alive = [p for p in players if p.hp > 0]
+    if not alive: return {b.id: (None, math.inf) for b in seekers}
+    d2 = _distances2(seekers, alive)
+    # Себя не видит, дальше радиуса обзора - тоже (сравниваем квадраты, корень - только у лучших)
+    d2[np.array([b.id for b in seekers])[:, None] == np.array([p.id for p in alive])[None, :]] = np.inf
+    radius = np.array([b.view_radius for b in seekers], np.float64)
+    d2[d2 >= (radius * radius)[:, None]] = np.inf
+    best = d2.argmin(axis=1)
+    best_dist = np.sqrt(d2[np.arange(len(seekers)), best])
+    return {b.id: (alive[j], d) if d < math.inf else (None, math.inf)
+            for b, j, d in zip(seekers, best.tolist(), best_dist.tolist())}
+
+def nearest_distance(seekers, others):
+    """Расстояние от центра каждого из seekers до ближайшего центра из others
+    (np.inf, если others пуст)"""
+    if not seekers: return np.zeros(0)
+    if not others: return np.full(len(seekers), np.inf)
+    return np.sqrt(_distances2(seekers, others).min(axis=1))
@@ -7,6 +7,13 @@ import time
 PARTICLE_SURF_CACHE = {}
 C_NEON_CYAN = (0, 255, 255)
 
+# Пуля сдвигается на свою скорость за кадр клиента (60 FPS): сервер и чужие
+# пули на клиенте ведут ее по времени с тем же темпом
+BULLET_RATE = 60
+# Команд ввода (кадров клиента) между выстрелами игрока: 10 в секунду.
+# Считает apply_input - одинаково на клиенте и на сервере
+FIRE_COOLDOWN = 6
+
 def get_particle_surf(size, color, alpha):
     # Преобразуем список цветов в кортеж, чтобы использовать как ключ словаря
     color_tuple = tuple(color)
@@ -17,6 +24,15 @@ def get_particle_surf(size, color, alpha):
         PARTICLE_SURF_CACHE[key] = s
     return PARTICLE_SURF_CACHE[key]
 
+def draw_bullet(win, x, y, vx, vy, scroll):
+    """Пуля со шлейфом назад по скорости"""
+    bx = x - scroll[0]
+    by = y - scroll[1]
+    pygame.draw.circle(win, (255, 200, 0), (int(bx-vx*2), int(by-vy*2)), 3)
+    pygame.draw.circle(win, (255, 200, 0), (int(bx-vx*1), int(by-vy*1)), 4)
+    pygame.draw.circle(win, (255, 255, 255), (int(bx), int(by)), 5)
+    pygame.draw.circle(win, (255, 0, 0), (int(bx), int(by)), 3)
+
 class Ability:
     def __init__(self, name, cooldown_frames, duration_frames):
         self.name = name
@@ -32,9 +48,10 @@ class Ability:
             return True
         return False
         
-    def update(self):
-        if self.duration > 0: self.duration -= 1
-        if self.cooldown > 0: self.cooldown -= 1
+    def update(self, step=1):
+        # step - сколько кадров прошло (сервер тикает не с частотой клиента)
+        if self.duration > 0: self.duration = max(0, self.duration - step)
+        if self.cooldown > 0: self.cooldown = max(0, self.cooldown - step)
         
 class ShieldAbility(Ability):
     def __init__(self):
@@ -45,7 +62,7 @@ class WallAbility(Ability):
         super().__init__("WALL", cooldown_frames=450, duration_frames=300)
 
 class Wall:
-    __slots__ = ('x', 'y', 'width', 'height', 'color', 'rect', 'lifetime', 'id', 'created_time')
+    __slots__ = ('x', 'y', 'width', 'height', 'color', 'rect', 'lifetime', 'id', 'created_time', 'expire_tick')
     WALL_DURATION = 5.0 
 
     def __init__(self, x, y, wall_id):
@@ -58,11 +75,25 @@ class Wall:
         self.id = wall_id
         self.created_time = time.time()
         self.lifetime = Wall.WALL_DURATION 
+        self.expire_tick = 0 # тик сервера, на котором стена исчезает
+
+    @classmethod
+    def from_state(cls, st, tick, tick_rate):
+        """Создает стену на клиенте из записи снапшота (protocol.WallState)
+        тика tick: до исчезновения осталось (expire_tick - tick) / tick_rate сек"""
+        wall = cls(st.x, st.y, st.id)
+        wall.expire_tick = st.expire_tick
+        wall.created_time = time.time() - cls.WALL_DURATION + (st.expire_tick - tick) / tick_rate
+        return wall
+
+    def time_left(self, now=None):
+        if now is None: now = time.time()
+        return self.created_time + self.WALL_DURATION - now
 
     def draw(self, win, scroll):
         screen_x = self.x - scroll[0]
         screen_y = self.y - scroll[1]
-        time_left = self.created_time + self.WALL_DURATION - time.time()
+        time_left = self.time_left()
         alpha = 255
         if time_left < 1.0: 
             self.color = (255, 50, 50)
@@ -83,7 +114,8 @@ class Player:
     
     __slots__ = ('x', 'y', 'width', 'height', 'color', 'rect', 'vel', 'hp', 
                 'bullets', 'id', 'nickname', 'last_move', 'trail_particles', 'skin_id', 'abilities', 
-                'trail_color', 'outline_color', 'kills', 'deaths', 'ping')
+                'trail_color', 'outline_color', 'kills', 'deaths', 'ping', 'rate', 'in_view', 'fire_cooldown')
+    is_bot = False
 
     def __init__(self, x, y, width, height, color, p_id):
         self.x = x
@@ -98,6 +130,7 @@ class Player:
         self.vel = 5
         self.hp = 100
         self.bullets = []
+        self.fire_cooldown = 0
         self.id = p_id 
         self.nickname = f"Игрок_{p_id}"
         self.last_move = (0, 0) 
@@ -110,6 +143,8 @@ class Player:
         self.kills = 0
         self.deaths = 0
         self.ping = 0
+        self.rate = 0 # КБ/с снапшотов, которые сервер шлет этому игроку
+        self.in_view = True
         
     # def get_rect(self):
         # return pygame.Rect(self.x, self.y, self.width, self.height)
@@ -182,12 +217,7 @@ class Player:
 
         # Bullets
         for bullet in self.bullets:
-            bx = bullet[0] - scroll[0]
-            by = bullet[1] - scroll[1]
-            pygame.draw.circle(win, (255, 200, 0), (int(bx-bullet[2]*2), int(by-bullet[3]*2)), 3)
-            pygame.draw.circle(win, (255, 200, 0), (int(bx-bullet[2]*1), int(by-bullet[3]*1)), 4)
-            pygame.draw.circle(win, (255, 255, 255), (int(bx), int(by)), 5)
-            pygame.draw.circle(win, (255, 0, 0), (int(bx), int(by)), 3)
+            draw_bullet(win, bullet[0], bullet[1], bullet[2], bullet[3], scroll)
 
     def _generate_trail_particles(self, screen_x, screen_y):
         dx, dy = self.last_move
@@ -222,30 +252,68 @@ class Player:
 
     def move(self, map_width, map_height):
         keys = pygame.key.get_pressed()
-        dx, dy = 0, 0
-        if keys[pygame.K_a] and self.x > 0: 
-            self.x -= self.vel; dx = -1
-        if keys[pygame.K_d] and self.x < map_width - self.width: 
-            self.x += self.vel; dx = 1
-        if keys[pygame.K_w] and self.y > 0: 
-            self.y -= self.vel; dy = -1
-        if keys[pygame.K_s] and self.y < map_height - self.height: 
-            self.y += self.vel; dy = 1
-        
-        self.last_move = (dx, dy) 
+        self.apply_move(keys[pygame.K_d] - keys[pygame.K_a], keys[pygame.K_s] - keys[pygame.K_w],
+                        map_width, map_height)
         self.update(map_width, map_height)
+
+    def apply_move(self, dx, dy, map_width, map_height):
+        """Шаг движения на vel по вектору dx, dy (-1..1) в границах карты.
+        Одна и та же функция на клиенте и на сервере"""
+        if dx: self.x = max(0, min(map_width - self.width, self.x + dx * self.vel))
+        if dy: self.y = max(0, min(map_height - self.height, self.y + dy * self.vel))
+        self.last_move = ((dx > 0) - (dx < 0), (dy > 0) - (dy < 0))
+        self.update_rect()
+
+    def apply_input(self, cmd, map_width, map_height, bullets=True):
+        """Один кадр команды ввода (protocol.InputCommand): выстрел, движение, пули.
+        bullets=False - пули не двигать (сервер двигает их раз за тик)"""
+        if self.fire_cooldown > 0: self.fire_cooldown -= 1
+        if cmd.fire and self.fire_cooldown <= 0:
+            self.shoot_angle(cmd.aim_angle)
+            self.fire_cooldown = FIRE_COOLDOWN
+        self.apply_move(*cmd.move, map_width, map_height)
+        if bullets: self.update(map_width, map_height)
+
+    def aim_angle(self, target_x, target_y, scroll=None):
+        """Угол от центра игрока на точку (экранную, если передан scroll)"""
+        if scroll:
+            target_x += scroll[0]
+            target_y += scroll[1]
+        return math.atan2(target_y - (self.y + self.height // 2), target_x - (self.x + self.width // 2))
         
+    def apply_state(self, st):
+        """Переносит запись из снапшота (protocol.PlayerState) в объект для отрисовки"""
+        self.kills = st.kills
+        self.deaths = st.deaths
+        self.ping = st.ping
+        self.rate = st.rate
+        self.nickname = st.nickname
+        self.skin_id = st.skin_id
+        self.in_view = st.in_view
+        if not st.in_view:
+            # Вне области интереса - только строка в таблице счета
+            return
+        self.x = st.x
+        self.y = st.y
+        self.hp = st.hp
+        self.last_move = st.last_move
+        self.abilities["shield"].duration = st.shield_duration
+        self.abilities["shield"].cooldown = st.shield_cooldown
+        self.abilities["wall"].duration = st.wall_duration
+        self.abilities["wall"].cooldown = st.wall_cooldown
+        self.update_rect()
+
     def setPose(self, x, y):
         self.x = x
         self.y = y
         self.update_rect()
 
-    def update(self, map_width, map_height):
+    def update(self, map_width, map_height, step=1):
         self.update_rect()
         to_remove = []
         for bullet in self.bullets:
-            bullet[0] += bullet[2]
-            bullet[1] += bullet[3]
+            bullet[0] += bullet[2] * step
+            bullet[1] += bullet[3] * step
             if not (-100 < bullet[0] < map_width + 100 and -100 < bullet[1] < map_height + 100):
                 to_remove.append(bullet)
         for b in to_remove: self.bullets.remove(b)
@@ -258,17 +326,11 @@ class Player:
         if bullet in self.bullets: self.bullets.remove(bullet)
 
     def shoot(self, target_x, target_y, scroll=None):
-        if scroll:
-            world_target_x = target_x + scroll[0]
-            world_target_y = target_y + scroll[1]
-        else:
-            world_target_x = target_x
-            world_target_y = target_y
+        self.shoot_angle(self.aim_angle(target_x, target_y, scroll))
+
+    def shoot_angle(self, angle):
         center_x = self.x + self.width // 2
         center_y = self.y + self.height // 2
-        dx = world_target_x - center_x
-        dy = world_target_y - center_y
-        angle = math.atan2(dy, dx)
         speed = 15 
         speed_x = speed * math.cos(angle)
         speed_y = speed * math.sin(angle)
@@ -283,6 +345,8 @@ class Player:
         self.last_move = (0,0)
 
 class Bot(Player):
+    is_bot = True
+
     def __init__(self, x, y, width, height, color, p_id):
         super().__init__(x, y, width, height, color, p_id)
         names = ["Terminator", "HAL-9000", "Skynet", "GLaDOS", "Bot_Vasyan", "CyberDemon", "Пидарас", "RoboCop", "Data", "Marvin", "WALL-E", "Bender", "T-800", "C-3PO", "R2-D2", "Optimus", "Megatron", "Ultron", "Jarvis", "Sonny", "Chappie", "ED-209", "Claptrap", "Хуесос", "Ботаник", "Роботяга", "Механик", "Андроид", "Автоматон", "Дроид", "Машина", "Синтетик", "Киборг"]
@@ -292,18 +356,21 @@ class Bot(Player):
         self.random_dir = (0, 0)
         self.view_radius = 800
         
-    def ai_move(self, all_players, map_width, map_height):
-        # 1. Поиск ближайшей цели
+    def revive(self, map_width, map_height):
+        """Убитый бот сразу возникает в случайной точке карты"""
+        if self.hp > 0: return
+        self.x = random.randint(100, map_width - 100)
+        self.y = random.randint(100, map_height - 100)
+        self.hp = 100
+        # Сразу: ИИ бота может быть не в этот тик, а хитбокс читают все
+        self.update_rect()
+
+    def find_target(self, all_players):
+        """(ближайший живой игрок в радиусе обзора или None, расстояние).
+        Сервер считает это сразу для всех ботов (perception.nearest_targets)"""
         closest_dist = float('inf')
         target = None
         my_center = (self.x + self.width//2, self.y + self.height//2)
-        
-        if self.hp <= 0:
-            self.x = random.randint(100, 2000 - 100)
-            self.y = random.randint(100, 2000 - 100)
-            self.hp = 100
-
-        
         for p_id, p in all_players.items():
             if p.id != self.id and p.hp > 0: # Игнорируем мертвых
                 other_center = (p.x + p.width//2, p.y + p.height//2)
@@ -312,6 +379,16 @@ class Bot(Player):
                 if dist < closest_dist and dist < self.view_radius:
                     closest_dist = dist
                     target = p
+        return target, closest_dist
+
+    def ai_move(self, all_players, map_width, map_height, step=1, seen=None):
+        """seen - готовый результат find_target за этот тик (после revive)"""
+        # 1. Поиск ближайшей цели
+        if seen is None:
+            self.revive(map_width, map_height)
+            seen = self.find_target(all_players)
+        target, closest_dist = seen
+        my_center = (self.x + self.width//2, self.y + self.height//2)
 
         dx, dy = 0, 0
         
@@ -322,13 +399,13 @@ class Bot(Player):
             
             dist_to_keep = 300
             if closest_dist > dist_to_keep:
-                self.x += math.cos(angle) * (self.vel * 0.8)
-                self.y += math.sin(angle) * (self.vel * 0.8)
+                self.x += math.cos(angle) * (self.vel * 0.8 * step)
+                self.y += math.sin(angle) * (self.vel * 0.8 * step)
                 dx = 1 if math.cos(angle) > 0 else -1
                 dy = 1 if math.sin(angle) > 0 else -1
             elif closest_dist < 150:
-                self.x -= math.cos(angle) * (self.vel * 0.8)
-                self.y -= math.sin(angle) * (self.vel * 0.8)
+                self.x -= math.cos(angle) * (self.vel * 0.8 * step)
+                self.y -= math.sin(angle) * (self.vel * 0.8 * step)
             
             if self.shoot_cooldown <= 0:
                 aim_x = target.x + random.randint(-20, 20)
@@ -343,15 +420,15 @@ class Bot(Player):
                 self.random_dir = (math.cos(angle), math.sin(angle))
                 self.change_dir_timer = 100
             
-            self.x += self.random_dir[0] * 2
-            self.y += self.random_dir[1] * 2
-            self.change_dir_timer -= 1
+            self.x += self.random_dir[0] * 2 * step
+            self.y += self.random_dir[1] * 2 * step
+            self.change_dir_timer -= step
             dx = 1 if self.random_dir[0] > 0 else -1
             dy = 1 if self.random_dir[1] > 0 else -1
 
         self.x = max(0, min(self.x, map_width - self.width))
         self.y = max(0, min(self.y, map_height - self.height))
 
-        if self.shoot_cooldown > 0: self.shoot_cooldown -= 1
+        if self.shoot_cooldown > 0: self.shoot_cooldown -= step
         self.last_move = (dx, dy)
-        self.update(map_width, map_height)
\ No newline at end of file
+        self.update_rect() # пули двигает сервер вместе со всеми
\ No newline at end of file
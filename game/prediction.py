@@ -0,0 +1,38 @@
+# --- ПРЕДСКАЗАНИЕ НА КЛИЕНТЕ ---
+# Свой игрок двигается сразу по своему вводу (та же apply_move, что на сервере).
+# Команды, которые сервер еще не подтвердил, лежат в кольцевом буфере.
+# Пришел снапшот: встаем в позицию сервера и заново проигрываем команды
+# новее client_seq - так поправка не дергает игрока назад на время пинга.
+
+
+class InputBuffer:
+    """Кольцевой буфер отправленных команд ввода по seq"""
+
+    def __init__(self, size=128):
+        self.size = size
+        self.commands = [None] * size
+        self.last_seq = 0
+        self.last_error = 0.0  # на сколько px разошлись с сервером при последней сверке
+
+    def push(self, cmd):
+        self.commands[cmd.seq % self.size] = cmd
+        self.last_seq = cmd.seq
+
+    def pending(self, acked_seq):
+        """Команды новее acked_seq по порядку (что не влезло в буфер - потеряно)"""
+        first = max(acked_seq + 1, self.last_seq - self.size + 1)
+        result = []
+        for seq in range(first, self.last_seq + 1):
+            cmd = self.commands[seq % self.size]
+            if cmd is not None and cmd.seq == seq: result.append(cmd)
+        return result
+
+    def reconcile(self, p, server_x, server_y, acked_seq, map_width, map_height):
+        """Позиция сервера + неподтвержденные команды = где мы сейчас"""
+        predicted = (p.x, p.y)
+        last_move = p.last_move
+        p.setPose(server_x, server_y)
+        for cmd in self.pending(acked_seq):
+            p.apply_move(*cmd.move, map_width, map_height)
+        self.last_error = abs(p.x - predicted[0]) + abs(p.y - predicted[1])
+        p.last_move = last_move
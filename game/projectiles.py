@@ -0,0 +1,49 @@
+import protocol
+from player import BULLET_RATE
+
+# --- ЧУЖИЕ ПУЛИ НА КЛИЕНТЕ ---
+# Сервер не шлет позиции пуль: клиент получает событие появления (точка,
+# скорость, тик) и сам считает, где пуля в момент t по времени сервера -
+# том же, в котором интерполируются чужие игроки (InterpolationBuffer).
+# Событие попадания или исчезновения задает момент, с которого пулю не видно.
+# Свои пули клиент ведет сам (предсказание), их события пропускаются.
+
+MAX_AGE = 5.0      # сек; страховка, если событие исчезновения потерялось
+MAP_MARGIN = 100   # пуля за краем карты дальше этого - исчезла (как на сервере)
+
+
+class BulletTracks:
+    """Летящие пули по id: [владелец, x0, y0, vx, vy, t0, t_end]"""
+
+    def __init__(self, skip_owner=None):
+        self.skip_owner = skip_owner
+        self.bullets = {}
+
+    def apply(self, events, tick_rate):
+        for ev in events:
+            if ev.kind == protocol.EVENT_SPAWN:
+                if ev.owner == self.skip_owner: continue
+                t0 = ev.tick / tick_rate
+                self.bullets[ev.bullet_id] = [ev.owner, ev.x, ev.y, ev.vx, ev.vy, t0, t0 + MAX_AGE]
+            else:
+                b = self.bullets.get(ev.bullet_id)
+                if b is not None: b[6] = min(b[6], ev.tick / tick_rate)
+
+    def at(self, t, map_width, map_height):
+        """[x, y, vx, vy] пуль, видимых в момент t. Отлетавшие выбрасываются"""
+        result = []
+        gone = []
+        for bullet_id, (owner, x0, y0, vx, vy, t0, t_end) in self.bullets.items():
+            if t >= t_end:
+                gone.append(bullet_id)
+                continue
+            if t < t0: continue  # у стрелка (он тоже в прошлом) еще не вылетела
+            k = (t - t0) * BULLET_RATE
+            x, y = x0 + vx * k, y0 + vy * k
+            if not (-MAP_MARGIN < x < map_width + MAP_MARGIN and -MAP_MARGIN < y < map_height + MAP_MARGIN):
+                gone.append(bullet_id)
+                continue
+            result.append([x, y, vx, vy])
+        for bullet_id in gone:
+            del self.bullets[bullet_id]
+        return result
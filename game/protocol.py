@@ -0,0 +1,678 @@
+import struct
+import itertools
+import quantize
+from collections import deque
+from quantize import POSITION, TIMER, MOVE, AIM, Raw
+
+# --- БИНАРНЫЙ ПРОТОКОЛ СНАПШОТОВ ---
+# Вместо pickle целых объектов Player (Rect, Ability, частицы, пули)
+# сервер шлет компактный снапшот фиксированными записями через struct.
+#
+# Снапшот - это дельта относительно базового снапшота (base_seq), который
+# клиент уже подтвердил (ack). base_seq == 0 значит "полный снапшот".
+# Неизменившиеся сущности не стоят ни байта. Координаты, таймеры и
+# скорости квантованы (см. quantize.py), float по сети не ходят.
+#
+# Область интереса: сущности (позиция, способности) шлются только
+# для игроков рядом с клиентом, ростер (таблица счета) - для всех.
+# Игрок, ушедший из области, попадает в removed, но остается в ростере.
+#
+# Мир тика собирается один раз на всех (WorldFrame): поля и упакованные
+# записи сущностей общие, на клиента приходится только сборка дельты.
+#
+# Пули в снапшот не входят: траектория пули задана точкой вылета, скоростью
+# и тиком, поэтому сервер шлет одно событие появления (EVENT_SPAWN), а клиент
+# сам ведет пулю до события попадания или исчезновения. События идут в общем
+# журнале (EventLog) с seq; в снапшот попадает хвост журнала после событий
+# подтвержденного клиентом снапшота - потерянное приедет снова, дубли клиент
+# отсеивает по seq.
+#
+# Стена приходит один раз с абсолютным тиком исчезновения: по сроку клиент
+# убирает ее сам, в walls_removed она не попадает.
+#
+# Бюджет: у соединения может быть лимит байт на снапшот. Тогда изменения
+# сущностей идут по очереди приоритетов: каждый тик неотправленное изменение
+# копит вес (близость к клиенту, попадания, новизна), в снапшот берутся самые
+# тяжелые, пока влезают. Не попавшие копят дальше и рано или поздно уходят.
+#
+# Формат снапшота (big-endian):
+#   HEADER                                версия, тип, seq, base_seq, client_seq, hold и размеры секций
+#   ENTITY_HEAD + поля по маске           измененные игроки
+#   ID * n_removed                        сущности, пропавшие с базового снапшота (ушли из области)
+#   ROSTER_HEAD + поля по маске           ник/скин/счет (строки переменной длины)
+#   ID * n_roster_removed                 игроки, вышедшие из игры
+#   WALL * n_walls_new                    новые стены (с тиком исчезновения)
+#   ID * n_walls_removed                  стены, убранные раньше срока
+#   CHAT * n_chat                         новые сообщения чата
+#   EVENT (+ тело по виду) * n_events     события пуль, seq с event_start по порядку
+#
+# Клиент шлет не объект Player, а команды ввода (MSG_INPUT): seq, вектор
+# движения, угол прицела, кнопки и тик. Двигает игрока сам сервер.
+#   INPUT_HEAD                            версия, тип, ack снапшота, пинг, число команд
+#   INPUT_CMD * n                         последние команды (новые - в конце)
+
+PROTOCOL_VERSION = 11
+
+MSG_SNAPSHOT = 1
+MSG_WELCOME = 2     # частота тика и токен для привязки UDP-канала (см. reliable.py)
+MSG_INPUT = 3       # клиент -> сервер: команды ввода
+
+# version, type, seq, base_seq, tick (номер тика сервера),
+# client_seq (последний обработанный пакет клиента - для пинга),
+# client_hold (сколько мс пакет ждал тика на сервере - вычитается из пинга),
+# n_entities, n_removed, n_roster, n_roster_removed, n_walls_new, n_walls_removed, n_chat,
+# event_start (seq первого события в снапшоте), n_events
+HEADER = struct.Struct('>BBIIIIHHHHHHHHIH')
+ENTITY_HEAD = struct.Struct('>iH')       # id, маска измененных полей
+ROSTER_HEAD = struct.Struct('>iB')
+ID = struct.Struct('>i')
+WALL = struct.Struct('>IHHhhI')          # id, x, y, width, height, тик исчезновения
+STR_LEN = struct.Struct('>B')
+CHAT_LEN = struct.Struct('>H')
+WELCOME = struct.Struct('>BBIHB')        # version, type, token (0 - без UDP), udp_port, tick_rate
+INPUT_HEAD = struct.Struct('>BBIHB')     # version, type, ack, ping, число команд
+INPUT_CMD = struct.Struct('>IIBBHB')     # seq, tick, move_x, move_y, aim, buttons
+EVENT = struct.Struct('>BII')            # вид, id пули, тик сервера
+EVENT_SPAWN_BODY = struct.Struct('>iHHBB')  # владелец, x, y, направление, скорость
+EVENT_HIT_BODY = struct.Struct('>i')     # в кого попала
+
+# Поля сущности в порядке битов маски и их квантование
+ENTITY_FIELDS = (
+    ('x', POSITION), ('y', POSITION), ('hp', quantize.HP),
+    ('shield_duration', TIMER), ('shield_cooldown', TIMER),
+    ('wall_duration', TIMER), ('wall_cooldown', TIMER),
+    ('move_dx', Raw('b')), ('move_dy', Raw('b')),
+)
+ENTITY_FULL_MASK = (1 << len(ENTITY_FIELDS)) - 1
+ENTITY_HP_BIT = 1 << [name for name, _ in ENTITY_FIELDS].index('hp')
+
+# Поля ростера (таблица счета). Два последних бита - ник и скин.
+ROSTER_FIELDS = (('kills', Raw('H')), ('deaths', Raw('H')), ('ping', Raw('H')), ('is_bot', Raw('B')),
+                 ('rate', Raw('H')))
+ROSTER_NICK_BIT = 1 << len(ROSTER_FIELDS)
+ROSTER_SKIN_BIT = ROSTER_NICK_BIT << 1
+ROSTER_FULL_MASK = (ROSTER_SKIN_BIT << 1) - 1
+
+HISTORY_SIZE = 32
+U16_MAX = 0xFFFF
+
+# События пуль
+EVENT_SPAWN = 1     # вылетела: владелец, точка и скорость в тик события
+EVENT_DESPAWN = 2   # исчезла (стена, край карты, респаун или выход владельца)
+EVENT_HIT = 3       # попала в игрока
+EVENT_LOG_SIZE = 4096      # событий в журнале сервера
+EVENTS_PER_SNAPSHOT = 512  # больше - остаток уйдет следующими снапшотами
+
+# Множители приоритета изменения сущности (к весу от сервера, см. DeltaEncoder.encode)
+PRIORITY_NEW = 4.0  # клиент сущность еще не видел
+PRIORITY_HP = 4.0   # изменилось hp: попадания и смерти заметнее всего
+
+# Кнопки команды ввода
+BTN_FIRE = 1
+BTN_SHIELD = 2
+BTN_WALL = 4
+# Сколько последних команд повторять в каждом пакете ввода: потерянная
+# датаграмма восполняется следующей, сервер применяет только новые seq
+INPUT_REDUNDANCY = 3
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+class PlayerState:
+    """Легкая запись игрока из снапшота (без pygame). После декодирования не меняется.
+    in_view - сущность в области интереса; иначе известны только поля ростера"""
+    __slots__ = ('id', 'in_view', 'x', 'y', 'hp', 'kills', 'deaths', 'ping', 'rate', 'is_bot',
+                 'nickname', 'skin_id', 'move_dx', 'move_dy',
+                 'shield_duration', 'shield_cooldown', 'wall_duration', 'wall_cooldown')
+
+    def __init__(self, p_id):
+        self.id = p_id
+        self.in_view = False
+        self.x = 0.0
+        self.y = 0.0
+        self.hp = 100
+        self.kills = 0
+        self.deaths = 0
+        self.ping = 0
+        self.rate = 0       # КБ/с снапшотов этому игроку
+        self.is_bot = False
+        self.nickname = ""
+        self.skin_id = "DEFAULT"
+        self.move_dx = 0
+        self.move_dy = 0
+        self.shield_duration = 0
+        self.shield_cooldown = 0
+        self.wall_duration = 0
+        self.wall_cooldown = 0
+
+    @property
+    def last_move(self):
+        return (self.move_dx, self.move_dy)
+
+    def copy(self):
+        st = PlayerState.__new__(PlayerState)
+        for name in PlayerState.__slots__:
+            setattr(st, name, getattr(self, name))
+        return st
+
+
+class InputCommand:
+    """Ввод одного кадра клиента. Значения уже квантованы - клиент и сервер
+    применяют одно и то же"""
+    __slots__ = ('seq', 'tick', 'move_x', 'move_y', 'aim', 'buttons')
+
+    def __init__(self, seq=0, tick=0, move_x=0, move_y=0, aim=0, buttons=0):
+        self.seq = seq
+        self.tick = tick      # последний тик сервера, который видел клиент
+        self.move_x = move_x
+        self.move_y = move_y
+        self.aim = aim
+        self.buttons = buttons
+
+    @classmethod
+    def build(cls, dx, dy, angle=0.0, buttons=0):
+        """dx, dy в -1..1, angle в радианах"""
+        return cls(0, 0, MOVE.encode(dx), MOVE.encode(dy), AIM.encode(angle), buttons)
+
+    @property
+    def move(self):
+        return (MOVE.decode(self.move_x), MOVE.decode(self.move_y))
+
+    @property
+    def aim_angle(self):
+        return AIM.decode(self.aim)
+
+    @property
+    def fire(self):
+        return bool(self.buttons & BTN_FIRE)
+
+
+class WallState:
+    __slots__ = ('id', 'x', 'y', 'width', 'height', 'expire_tick')
+
+    def __init__(self, w_id, x, y, width, height, expire_tick):
+        self.id = w_id
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.expire_tick = expire_tick
+
+
+class BulletEvent:
+    """Событие пули из снапшота. Для EVENT_SPAWN заполнены owner, x, y, vx, vy,
+    для EVENT_HIT - target"""
+    __slots__ = ('seq', 'kind', 'bullet_id', 'tick', 'owner', 'x', 'y', 'vx', 'vy', 'target')
+
+    def __init__(self, seq, kind, bullet_id, tick):
+        self.seq = seq
+        self.kind = kind
+        self.bullet_id = bullet_id
+        self.tick = tick
+        self.owner = None
+        self.x = self.y = self.vx = self.vy = 0.0
+        self.target = None
+
+
+class Snapshot:
+    __slots__ = ('seq', 'tick', 'client_seq', 'client_hold', 'players', 'walls', 'chat', 'events')
+
+    def __init__(self, seq):
+        self.seq = seq
+        self.tick = 0
+        self.client_seq = 0
+        self.client_hold = 0
+        self.players = {}
+        self.walls = {}
+        self.chat = []
+        self.events = []
+
+
+# Struct на каждую встречающуюся маску, чтобы паковать поля одним вызовом
+_MASK_STRUCTS = {}
+
+
+def _mask_struct(fields, mask):
+    key = (fields, mask)
+    st = _MASK_STRUCTS.get(key)
+    if st is None:
+        codes = ''.join(q.code for i, (_, q) in enumerate(fields) if mask & (1 << i))
+        st = _MASK_STRUCTS[key] = struct.Struct('>' + codes)
+    return st
+
+
+def _clamp_u16(value):
+    return max(0, min(U16_MAX, int(value)))
+
+
+def _pack_str(text, limit=255):
+    raw = str(text).encode('utf-8')[:limit]
+    return STR_LEN.pack(len(raw)) + raw
+
+
+def _changed_mask(old, new):
+    mask = 0
+    for i, (a, b) in enumerate(zip(old, new)):
+        if a != b: mask |= 1 << i
+    return mask
+
+
+def entity_state(p):
+    """Кортеж квантованных полей сущности в порядке ENTITY_FIELDS.
+    Сравнение идет по квантованным значениям - дрожание меньше шага не шлется"""
+    shield = p.abilities["shield"]
+    wall = p.abilities["wall"]
+    dx, dy = p.last_move
+    return (POSITION.encode(p.x), POSITION.encode(p.y), quantize.HP.encode(p.hp),
+            TIMER.encode(shield.duration), TIMER.encode(shield.cooldown),
+            TIMER.encode(wall.duration), TIMER.encode(wall.cooldown),
+            int(dx), int(dy))
+
+
+def roster_state(p):
+    return (_clamp_u16(p.kills), _clamp_u16(p.deaths), _clamp_u16(p.ping),
+            1 if p.is_bot else 0, _clamp_u16(p.rate), p.nickname, p.skin_id)
+
+
+class WorldFrame:
+    """Мир одного тика - общий для всех соединений. Поля сущностей считаются
+    один раз, упакованные записи кэшируются по (id, маска): клиенты с одной
+    и той же базой получают одни и те же bytes без повторной упаковки"""
+
+    def __init__(self, players, walls, tick=0):
+        self.tick = tick
+        self.entities = {p.id: entity_state(p) for p in players}
+        self.rosters = {p.id: roster_state(p) for p in players}
+        self.walls = {w.id: w for w in walls}
+        self.wall_ids = frozenset(self.walls)
+        self._entity_records = {}  # (id, маска) -> bytes
+        self._roster_records = {}
+        self._wall_records = {}    # id -> bytes
+
+    def entity_record(self, p_id, mask):
+        key = (p_id, mask)
+        record = self._entity_records.get(key)
+        if record is None:
+            state = self.entities[p_id]
+            record = ENTITY_HEAD.pack(p_id, mask)
+            if mask:
+                record += _mask_struct(ENTITY_FIELDS, mask).pack(
+                    *[v for i, v in enumerate(state) if mask & (1 << i)])
+            self._entity_records[key] = record
+        return record
+
+    def roster_record(self, p_id, mask):
+        key = (p_id, mask)
+        record = self._roster_records.get(key)
+        if record is None:
+            state = self.rosters[p_id]
+            scalar_mask = mask & (ROSTER_NICK_BIT - 1)
+            parts = [ROSTER_HEAD.pack(p_id, mask)]
+            if scalar_mask:
+                parts.append(_mask_struct(ROSTER_FIELDS, scalar_mask).pack(
+                    *[v for i, v in enumerate(state[:-2]) if scalar_mask & (1 << i)]))
+            if mask & ROSTER_NICK_BIT: parts.append(_pack_str(state[-2]))
+            if mask & ROSTER_SKIN_BIT: parts.append(_pack_str(state[-1]))
+            record = self._roster_records[key] = b''.join(parts)
+        return record
+
+    def wall_record(self, w_id):
+        record = self._wall_records.get(w_id)
+        if record is None:
+            w = self.walls[w_id]
+            record = self._wall_records[w_id] = WALL.pack(w.id, POSITION.encode(w.x), POSITION.encode(w.y),
+                                                          w.width, w.height, w.expire_tick & 0xFFFFFFFF)
+        return record
+
+
+class EventLog:
+    """Журнал событий пуль сервера - общий для всех соединений. Каждое событие
+    упаковывается один раз, seq растет с 1, старые события вытесняются"""
+
+    def __init__(self, size=EVENT_LOG_SIZE):
+        self.records = deque(maxlen=size)
+        self.last_seq = 0
+        self.live = {}  # id летящей пули -> seq события ее появления
+
+    @property
+    def first_seq(self):
+        return self.last_seq - len(self.records) + 1
+
+    def _append(self, record):
+        self.records.append(record)
+        self.last_seq += 1
+
+    def spawn(self, bullet_id, owner, tick, x, y, vx, vy):
+        """Пуля вылетела. Возвращает (x, y, vx, vy) после квантования - сервер
+        ведет пулю по ним же, и траектория у всех совпадает"""
+        qx, qy = POSITION.encode(x), POSITION.encode(y)
+        direction, speed = quantize.encode_velocity(vx, vy)
+        self._append(EVENT.pack(EVENT_SPAWN, bullet_id, tick & 0xFFFFFFFF) +
+                     EVENT_SPAWN_BODY.pack(owner, qx, qy, direction, speed))
+        self.live[bullet_id] = self.last_seq
+        return (POSITION.decode(qx), POSITION.decode(qy), *quantize.decode_velocity(direction, speed))
+
+    def despawn(self, bullet_id, tick):
+        if self.live.pop(bullet_id, None) is None: return
+        self._append(EVENT.pack(EVENT_DESPAWN, bullet_id, tick & 0xFFFFFFFF))
+
+    def hit(self, bullet_id, tick, target):
+        if self.live.pop(bullet_id, None) is None: return
+        self._append(EVENT.pack(EVENT_HIT, bullet_id, tick & 0xFFFFFFFF) + EVENT_HIT_BODY.pack(target))
+
+    def join_seq(self):
+        """После какого seq слать новому клиенту: он должен увидеть все летящие пули"""
+        return min(self.live.values(), default=self.last_seq + 1) - 1
+
+    def since(self, seq, limit=EVENTS_PER_SNAPSHOT):
+        """(seq первого, [записи]) - события новее seq, не больше limit"""
+        start = max(seq + 1, self.first_seq)
+        skip = start - self.first_seq
+        return start, list(itertools.islice(self.records, skip, skip + limit))
+
+
+def _priority_boost(mask):
+    if mask == ENTITY_FULL_MASK: return PRIORITY_NEW
+    if mask & ENTITY_HP_BIT: return PRIORITY_HP
+    return 1.0
+
+
+class DeltaEncoder:
+    """Серверная сторона одного соединения: история отправленных снапшотов и дельты к подтвержденному.
+    event_seq - события до этого seq клиенту не нужны (см. EventLog.join_seq)"""
+
+    def __init__(self, history_size=HISTORY_SIZE, event_seq=0):
+        self.seq = 0
+        self.acked = 0
+        self.history_size = history_size
+        # seq -> (WorldFrame, {id: состояние сущности у клиента}, seq последнего события)
+        self.history = {}
+        self.event_seq = event_seq
+        self.priority = {}  # id -> накопленный приоритет неотправленного изменения
+        self.deferred = 0   # изменений, отложенных бюджетом, за все время
+
+    def ack(self, seq):
+        """Клиент подтвердил снапшот seq - он станет базой для следующих дельт"""
+        if seq > self.acked and seq in self.history:
+            self.acked = seq
+            for old in [s for s in self.history if s < seq]:
+                del self.history[old]
+
+    def encode(self, frame, chat=(), client_seq=0, client_hold=0, visible=None, events=None,
+               budget=None, weights=None):
+        """Дельта мира тика (WorldFrame) и новых сообщений к последнему ack.
+        visible - id игроков в области интереса клиента (None - все),
+        events - журнал событий пуль (EventLog): идут все после подтвержденных,
+        budget - лимит байт снапшота (None - без лимита), weights - id -> вес
+        сущности для очереди приоритетов (нет в weights - 1.0)"""
+        entity_ids = frame.entities.keys() if visible is None else visible & frame.entities.keys()
+
+        base_seq = self.acked if self.acked in self.history else 0
+        if base_seq:
+            base, base_ents, base_event_seq = self.history[base_seq]
+            base_rost, base_walls = base.rosters, base.walls
+        else:
+            base_ents, base_rost, base_walls = {}, {}, {}
+            base_event_seq = self.event_seq
+
+        changed = []  # (id, маска)
+        for p_id in entity_ids:
+            state = frame.entities[p_id]
+            old = base_ents.get(p_id)
+            if old is state or old == state: continue
+            changed.append((p_id, ENTITY_FULL_MASK if old is None else _changed_mask(old, state)))
+        removed = [p_id for p_id in base_ents if p_id not in entity_ids]
+
+        roster_parts = []
+        for p_id, state in frame.rosters.items():
+            old = base_rost.get(p_id)
+            if old is state or old == state: continue
+            mask = ROSTER_FULL_MASK if old is None else _changed_mask(old, state)
+            roster_parts.append(frame.roster_record(p_id, mask))
+        roster_removed = [p_id for p_id in base_rost if p_id not in frame.rosters]
+
+        # Стены не меняются - шлем только появление. Истекшие клиент убирает сам
+        wall_parts = [frame.wall_record(w_id) for w_id in frame.wall_ids if w_id not in base_walls]
+        walls_removed = [w_id for w_id, w in base_walls.items()
+                         if w_id not in frame.wall_ids and w.expire_tick > frame.tick]
+
+        chat_parts = []
+        for msg in chat:
+            raw = str(msg).encode('utf-8')[:U16_MAX]
+            chat_parts.append(CHAT_LEN.pack(len(raw)))
+            chat_parts.append(raw)
+
+        if events is not None: event_start, event_parts = events.since(base_event_seq)
+        else: event_start, event_parts = base_event_seq + 1, []
+
+        if budget is None:
+            sent = changed
+        else:
+            fixed = (HEADER.size + ID.size * (len(removed) + len(roster_removed) + len(walls_removed)) +
+                     sum(map(len, roster_parts)) + sum(map(len, wall_parts)) +
+                     sum(map(len, chat_parts)) + sum(map(len, event_parts)))
+            sent = self._schedule(frame, changed, budget - fixed, weights or {})
+        entity_parts = [frame.entity_record(p_id, mask) for p_id, mask in sent]
+
+        # Что будет у клиента после этого снапшота: отложенные бюджетом - как в базе
+        states = {p_id: st for p_id, st in base_ents.items() if p_id in entity_ids}
+        for p_id, _ in sent:
+            states[p_id] = frame.entities[p_id]
+
+        self.seq += 1
+        self.history[self.seq] = (frame, states, event_start + len(event_parts) - 1)
+        for old in [s for s in self.history if s <= self.seq - self.history_size and s != base_seq]:
+            del self.history[old]
+
+        header = HEADER.pack(PROTOCOL_VERSION, MSG_SNAPSHOT, self.seq, base_seq, frame.tick & 0xFFFFFFFF,
+                             client_seq & 0xFFFFFFFF, _clamp_u16(client_hold), len(entity_parts), len(removed),
+                             len(roster_parts), len(roster_removed), len(wall_parts), len(walls_removed), len(chat),
+                             event_start & 0xFFFFFFFF, len(event_parts))
+        return b''.join([header, *entity_parts,
+                         *(ID.pack(p_id) for p_id in removed),
+                         *roster_parts,
+                         *(ID.pack(p_id) for p_id in roster_removed),
+                         *wall_parts,
+                         *(ID.pack(w_id) for w_id in walls_removed),
+                         *chat_parts, *event_parts])
+
+    def _schedule(self, frame, changed, budget, weights):
+        """Изменения, которые влезают в budget байт, по накопленному приоритету.
+        Самое важное уходит всегда - иначе при крошечном бюджете все встанет"""
+        priority = {}
+        for p_id, mask in changed:
+            priority[p_id] = self.priority.get(p_id, 0.0) + weights.get(p_id, 1.0) * _priority_boost(mask)
+        sent = []
+        for p_id, mask in sorted(changed, key=lambda c: priority[c[0]], reverse=True):
+            size = len(frame.entity_record(p_id, mask))
+            if sent and size > budget: continue
+            budget -= size
+            sent.append((p_id, mask))
+            del priority[p_id]
+        self.deferred += len(priority)
+        self.priority = priority
+        return sent
+
+
+def frame_type(data):
+    """Тип сообщения в кадре от сервера (MSG_SNAPSHOT / MSG_WELCOME)"""
+    if len(data) < 2:
+        raise ProtocolError("Слишком короткий кадр")
+    if data[0] != PROTOCOL_VERSION:
+        raise ProtocolError(f"Неизвестная версия протокола: {data[0]}")
+    return data[1]
+
+
+def encode_welcome(token, udp_port, tick_rate):
+    return WELCOME.pack(PROTOCOL_VERSION, MSG_WELCOME, token, udp_port, tick_rate)
+
+
+def decode_welcome(data):
+    try:
+        _, _, token, udp_port, tick_rate = WELCOME.unpack_from(data)
+    except struct.error as e:
+        raise ProtocolError(f"Битый WELCOME: {e}") from e
+    return token, udp_port, tick_rate
+
+
+def encode_input(commands, ack, ping=0):
+    """Пакет ввода: до 255 последних команд (старые первыми)"""
+    commands = list(commands)[-255:]
+    return b''.join([INPUT_HEAD.pack(PROTOCOL_VERSION, MSG_INPUT, ack, _clamp_u16(ping), len(commands)),
+                     *(INPUT_CMD.pack(c.seq, c.tick, c.move_x, c.move_y, c.aim, c.buttons) for c in commands)])
+
+
+def decode_input(data):
+    """(ack, ping, [InputCommand])"""
+    try:
+        version, msg_type, ack, ping, n = INPUT_HEAD.unpack_from(data)
+        if version != PROTOCOL_VERSION:
+            raise ProtocolError(f"Неизвестная версия протокола: {version}")
+        if msg_type != MSG_INPUT:
+            raise ProtocolError(f"Неожиданный тип сообщения: {msg_type}")
+        end = INPUT_HEAD.size + n * INPUT_CMD.size
+        commands = [InputCommand(*fields) for fields in INPUT_CMD.iter_unpack(data[INPUT_HEAD.size:end])]
+    except struct.error as e:
+        raise ProtocolError(f"Битый ввод: {e}") from e
+    if len(commands) != n:
+        raise ProtocolError("Битый ввод: не хватает команд")
+    return ack, ping, commands
+
+
+def _read_str(data, offset):
+    (n,) = STR_LEN.unpack_from(data, offset)
+    offset += STR_LEN.size
+    return bytes(data[offset:offset + n]).decode('utf-8', 'replace'), offset + n
+
+
+class SnapshotDecoder:
+    """Клиентская сторона: хранит последние снапшоты, чтобы применять к ним дельты"""
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.history_size = history_size
+        self.history = {}  # seq -> Snapshot
+        self.latest = 0    # seq, который подтверждаем серверу (ack)
+        self.base = 0      # последняя база дельты от сервера: старше он уже не возьмет
+
+    def decode(self, data):
+        """Разбирает bytes снапшота в полный Snapshot с PlayerState/WallState"""
+        try:
+            (version, msg_type, seq, base_seq, tick, client_seq, client_hold, n_entities, n_removed,
+             n_roster, n_roster_removed, n_walls_new, n_walls_removed, n_chat,
+             event_start, n_events) = HEADER.unpack_from(data, 0)
+            if version != PROTOCOL_VERSION:
+                raise ProtocolError(f"Неизвестная версия протокола: {version}")
+            if msg_type != MSG_SNAPSHOT:
+                raise ProtocolError(f"Неожиданный тип сообщения: {msg_type}")
+
+            snap = Snapshot(seq)
+            snap.tick = tick
+            snap.client_seq = client_seq
+            snap.client_hold = client_hold
+            if base_seq:
+                base = self.history.get(base_seq)
+                if base is None:
+                    raise ProtocolError(f"Нет базового снапшота {base_seq}")
+                snap.players = dict(base.players)
+                snap.walls = dict(base.walls)
+
+            offset = HEADER.size
+            touched = set()
+            for _ in range(n_entities):
+                p_id, mask = ENTITY_HEAD.unpack_from(data, offset)
+                offset += ENTITY_HEAD.size
+                old = snap.players.get(p_id)
+                st = old.copy() if old is not None else PlayerState(p_id)
+                if mask:
+                    fmt = _mask_struct(ENTITY_FIELDS, mask)
+                    values = iter(fmt.unpack_from(data, offset))
+                    offset += fmt.size
+                    for i, (name, q) in enumerate(ENTITY_FIELDS):
+                        if mask & (1 << i): setattr(st, name, q.decode(next(values)))
+                st.in_view = True
+                snap.players[p_id] = st
+                touched.add(p_id)
+
+            for _ in range(n_removed):
+                (p_id,) = ID.unpack_from(data, offset)
+                offset += ID.size
+                old = snap.players.get(p_id)
+                if old is not None:
+                    # Ушел из области интереса - в ростере остается
+                    st = snap.players[p_id] = old.copy()
+                    st.in_view = False
+                    touched.add(p_id)
+
+            for _ in range(n_roster):
+                p_id, mask = ROSTER_HEAD.unpack_from(data, offset)
+                offset += ROSTER_HEAD.size
+                st = snap.players.get(p_id)
+                if st is None:
+                    st = snap.players[p_id] = PlayerState(p_id)
+                    touched.add(p_id)
+                elif p_id not in touched:
+                    st = snap.players[p_id] = st.copy()
+                    touched.add(p_id)
+                scalar_mask = mask & (ROSTER_NICK_BIT - 1)
+                if scalar_mask:
+                    fmt = _mask_struct(ROSTER_FIELDS, scalar_mask)
+                    values = iter(fmt.unpack_from(data, offset))
+                    offset += fmt.size
+                    for i, (name, _) in enumerate(ROSTER_FIELDS):
+                        if scalar_mask & (1 << i): setattr(st, name, next(values))
+                st.is_bot = bool(st.is_bot)
+                if mask & ROSTER_NICK_BIT: st.nickname, offset = _read_str(data, offset)
+                if mask & ROSTER_SKIN_BIT: st.skin_id, offset = _read_str(data, offset)
+
+            for _ in range(n_roster_removed):
+                (p_id,) = ID.unpack_from(data, offset)
+                offset += ID.size
+                snap.players.pop(p_id, None)
+
+            for _ in range(n_walls_new):
+                w_id, x, y, width, height, expire_tick = WALL.unpack_from(data, offset)
+                offset += WALL.size
+                snap.walls[w_id] = WallState(w_id, POSITION.decode(x), POSITION.decode(y), width, height, expire_tick)
+
+            for _ in range(n_walls_removed):
+                (w_id,) = ID.unpack_from(data, offset)
+                offset += ID.size
+                snap.walls.pop(w_id, None)
+            for w_id in [w_id for w_id, w in snap.walls.items() if w.expire_tick <= tick]:
+                del snap.walls[w_id]
+
+            for _ in range(n_chat):
+                (n,) = CHAT_LEN.unpack_from(data, offset)
+                offset += CHAT_LEN.size
+                snap.chat.append(bytes(data[offset:offset + n]).decode('utf-8', 'replace'))
+                offset += n
+
+            for i in range(n_events):
+                kind, bullet_id, event_tick = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                ev = BulletEvent(event_start + i, kind, bullet_id, event_tick)
+                if kind == EVENT_SPAWN:
+                    ev.owner, x, y, direction, speed = EVENT_SPAWN_BODY.unpack_from(data, offset)
+                    offset += EVENT_SPAWN_BODY.size
+                    ev.x, ev.y = POSITION.decode(x), POSITION.decode(y)
+                    ev.vx, ev.vy = quantize.decode_velocity(direction, speed)
+                elif kind == EVENT_HIT:
+                    (ev.target,) = EVENT_HIT_BODY.unpack_from(data, offset)
+                    offset += EVENT_HIT_BODY.size
+                elif kind != EVENT_DESPAWN:
+                    raise ProtocolError(f"Неизвестное событие: {kind}")
+                snap.events.append(ev)
+        except struct.error as e:
+            raise ProtocolError(f"Битый снапшот: {e}") from e
+
+        self.history[seq] = snap
+        if seq > self.latest: self.latest = seq
+        # База сервера (его последний принятый ack) хранится, пока он ее использует,
+        # сколько бы ack ни задерживались: дальше сервер отключит нас сам (LAG_TIMEOUT)
+        if base_seq > self.base: self.base = base_seq
+        for old in [s for s in self.history
+                    if s < self.base or (s <= self.latest - self.history_size and s != self.base)]:
+            del self.history[old]
+        return snap
@@ -0,0 +1,83 @@
+import math
+
+# --- КВАНТОВАНИЕ ПОЛЕЙ ПРОТОКОЛА ---
+# Вместо float32 по сети идут целые фиксированной точности: карта 2000x2000
+# укладывается в 16 бит с шагом ~0.04 px, направление пули - в 8 бит.
+# Кодирование и декодирование детерминированы и одинаковы на сервере и на
+# клиенте (через protocol.py), поэтому одно и то же значение после
+# декодирования везде совпадает бит в бит.
+# Точность настраивается здесь; смена требует новой версии протокола.
+
+WORLD_MIN = -256.0      # с запасом: пули живут до 100 px за краем карты
+WORLD_MAX = 2304.0
+POSITION_BITS = 16
+BULLET_DIR_BITS = 8     # направление пули (скорость постоянна)
+BULLET_SPEED_MAX = 31.875
+AIM_BITS = 16           # прицел в команде ввода - точнее, это точка выстрела
+TIMER_MAX = 510.0       # кадров способностей; 8 бит = шаг 2 кадра
+
+
+class Quantizer:
+    """float из [lo, hi] <-> целое 0..steps (за границами - обрезается)"""
+
+    def __init__(self, lo, hi, bits, steps=None):
+        self.lo = lo
+        self.hi = hi
+        self.steps = (1 << bits) - 1 if steps is None else steps
+        self.scale = self.steps / (hi - lo)
+        self.code = {8: 'B', 16: 'H', 32: 'I'}[bits]
+
+    def encode(self, value):
+        return max(0, min(self.steps, round((value - self.lo) * self.scale)))
+
+    def decode(self, q):
+        return self.lo + q / self.scale
+
+
+class AngleQuantizer:
+    """Угол в радианах по кругу: 0..2pi <-> 0..2^bits-1"""
+
+    def __init__(self, bits):
+        self.size = 1 << bits
+        self.scale = self.size / (2 * math.pi)
+        self.code = {8: 'B', 16: 'H'}[bits]
+
+    def encode(self, angle):
+        return round((angle % (2 * math.pi)) * self.scale) % self.size
+
+    def decode(self, q):
+        return q / self.scale
+
+
+class Raw:
+    """Целое как есть, с обрезкой по диапазону типа (счетчики, флаги, hp)"""
+    RANGES = {'b': (-128, 127), 'B': (0, 255), 'h': (-32768, 32767), 'H': (0, 65535)}
+
+    def __init__(self, code):
+        self.code = code
+        self.lo, self.hi = self.RANGES[code]
+
+    def encode(self, value):
+        return max(self.lo, min(self.hi, int(value)))
+
+    def decode(self, q):
+        return q
+
+
+POSITION = Quantizer(WORLD_MIN, WORLD_MAX, POSITION_BITS)
+BULLET_DIR = AngleQuantizer(BULLET_DIR_BITS)
+BULLET_SPEED = Quantizer(0.0, BULLET_SPEED_MAX, 8)
+AIM = AngleQuantizer(AIM_BITS)
+MOVE = Quantizer(-1.0, 1.0, 8, steps=254)  # 127 - ровно ноль
+HP = Raw('b')                               # шаг 1 hp, ниже нуля - на последнем попадании
+TIMER = Quantizer(0.0, TIMER_MAX, 8)
+
+
+def encode_velocity(vx, vy):
+    return BULLET_DIR.encode(math.atan2(vy, vx)), BULLET_SPEED.encode(math.hypot(vx, vy))
+
+
+def decode_velocity(direction, speed):
+    angle = BULLET_DIR.decode(direction)
+    speed = BULLET_SPEED.decode(speed)
+    return speed * math.cos(angle), speed * math.sin(angle)
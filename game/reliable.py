@@ -0,0 +1,191 @@
+import struct
+import time
+
+# --- UDP-КАНАЛ С ТОНКИМ СЛОЕМ НАДЕЖНОСТИ ---
+# Снапшоты и ввод идут ненадежно: потерялся - следующий все равно новее.
+# События (чат, попадания) идут надежно и по порядку:
+# каждая датаграмма несет ack + 32 бита ack_bits о полученных датаграммах
+# другой стороны, а неподтвержденные сообщения переотправляются.
+#
+# Датаграмма (big-endian):
+#   DATAGRAM                      версия, вид, токен, seq, ack, ack_bits
+#   COUNT + (MSG_HEAD + данные)*  надежные сообщения
+#   остаток                       ненадежная нагрузка (снапшот / ввод)
+
+UDP_VERSION = 1
+
+KIND_HELLO = 1      # клиент -> сервер: привязать адрес к соединению по токену (и ответ сервера)
+KIND_SNAPSHOT = 2   # сервер -> клиент
+KIND_INPUT = 3      # клиент -> сервер
+
+DATAGRAM = struct.Struct('>BBIIII')
+MSG_HEAD = struct.Struct('>HH')      # id сообщения, длина
+COUNT = struct.Struct('>B')
+
+# Больше этого датаграмма рискует фрагментироваться - такое шлем по TCP
+UDP_MAX_PAYLOAD = 1200
+ACK_WINDOW = 32
+# Неподтвержденных надежных сообщений не больше этого: другая сторона не
+# подтверждает - значит, отстала безнадежно (и 16-битные id не переполнятся)
+MAX_OUTGOING = 256
+
+
+class ChannelError(ValueError):
+    pass
+
+
+def _id_newer(a, b):
+    """a новее b для 16-битных id с переполнением"""
+    return a != b and ((a - b) & 0xFFFF) < 0x8000
+
+
+def peek_header(data):
+    """(version, kind, token) без разбора остального - чтобы найти соединение"""
+    if len(data) < DATAGRAM.size:
+        raise ChannelError("Слишком короткая датаграмма")
+    version, kind, token = struct.unpack_from('>BBI', data)
+    if version != UDP_VERSION:
+        raise ChannelError(f"Неизвестная версия UDP: {version}")
+    return version, kind, token
+
+
+class ReliableChannel:
+    """Одна сторона UDP-канала: seq датаграмм, ack-битовые поля, переотправка событий"""
+
+    def __init__(self, token, resend_after=0.1, max_outgoing=MAX_OUTGOING):
+        self.token = token
+        self.resend_after = resend_after
+        self.max_outgoing = max_outgoing
+        self.rtt = None  # сек, по подтвержденным датаграммам
+
+        # Исходящие датаграммы
+        self.local_seq = 0
+        self.in_flight = {}  # seq датаграммы -> (время отправки, [id сообщений])
+
+        # Входящие датаграммы
+        self.remote_seq = 0
+        self.remote_bits = 0
+
+        # Надежные сообщения
+        self.next_msg_id = 0
+        self.outgoing = {}   # id -> [данные, время последней отправки или None]
+        self.expected_id = 0
+        self.early = {}      # пришедшие вне очереди: id -> данные
+
+        self.stats = {"resent": 0, "lost": 0, "stale": 0}
+
+    def queue(self, payload):
+        """Ставит надежное сообщение в очередь (дойдет, и по порядку)"""
+        if len(payload) > UDP_MAX_PAYLOAD:
+            raise ChannelError("Надежное сообщение больше датаграммы")
+        if len(self.outgoing) >= self.max_outgoing:
+            raise ChannelError(f"Очередь надежных сообщений переполнена ({self.max_outgoing})")
+        self.outgoing[self.next_msg_id] = [payload, None]
+        self.next_msg_id = (self.next_msg_id + 1) & 0xFFFF
+
+    def _due(self, now):
+        """Сообщения, которым пора уйти (впервые или повторно), по порядку id - не больше 255"""
+        resend_after = self.resend_after if self.rtt is None else max(self.resend_after, self.rtt * 1.5)
+        due = []
+        for msg_id, entry in self.outgoing.items():
+            if len(due) >= 255: break
+            if entry[1] is not None and now - entry[1] < resend_after: continue
+            due.append((msg_id, entry))
+        return due
+
+    def due_size(self, limit=UDP_MAX_PAYLOAD, now=None):
+        """Сколько байт надежных сообщений уйдет следующей датаграммой (не больше limit).
+        Столько места отправитель оставляет им, урезая ненадежную нагрузку:
+        build кладет сообщения только в остаток после нее"""
+        if now is None: now = time.perf_counter()
+        total = 0
+        for _, (data, _) in self._due(now):
+            size = MSG_HEAD.size + len(data)
+            if total + size > limit: break
+            total += size
+        return total
+
+    def build(self, kind, payload=b'', now=None):
+        """Собирает датаграмму: заголовок с ack, сообщения к (пере)отправке, нагрузка"""
+        if now is None: now = time.perf_counter()
+        self.local_seq += 1
+
+        budget = UDP_MAX_PAYLOAD - len(payload)
+        parts = []
+        sent_ids = []
+        for msg_id, entry in self._due(now):
+            data, last_sent = entry
+            size = MSG_HEAD.size + len(data)
+            if size > budget: break
+            if last_sent is not None: self.stats["resent"] += 1
+            parts.append(MSG_HEAD.pack(msg_id, len(data)))
+            parts.append(data)
+            entry[1] = now
+            sent_ids.append(msg_id)
+            budget -= size
+
+        self.in_flight[self.local_seq] = (now, sent_ids)
+        for old in [s for s in self.in_flight if s <= self.local_seq - ACK_WINDOW * 4]:
+            del self.in_flight[old]
+            self.stats["lost"] += 1
+
+        header = DATAGRAM.pack(UDP_VERSION, kind, self.token, self.local_seq,
+                               self.remote_seq, self.remote_bits)
+        return b''.join([header, COUNT.pack(len(sent_ids)), *parts, payload])
+
+    def receive(self, data, now=None):
+        """Разбирает датаграмму. Возвращает (kind, payload, сообщения по порядку, stale).
+        stale - датаграмма старее уже полученной (ненадежную нагрузку стоит выбросить)"""
+        if now is None: now = time.perf_counter()
+        try:
+            version, kind, token, seq, ack, ack_bits = DATAGRAM.unpack_from(data)
+            if token != self.token:
+                raise ChannelError("Чужой токен")
+            offset = DATAGRAM.size
+            (n_msgs,) = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            messages = []
+            for _ in range(n_msgs):
+                msg_id, size = MSG_HEAD.unpack_from(data, offset)
+                offset += MSG_HEAD.size
+                messages.append((msg_id, bytes(data[offset:offset + size])))
+                offset += size
+            payload = bytes(data[offset:])
+        except struct.error as e:
+            raise ChannelError(f"Битая датаграмма: {e}") from e
+
+        # 1. Отмечаем полученный seq
+        stale = False
+        if seq > self.remote_seq:
+            shift = seq - self.remote_seq
+            self.remote_bits = ((self.remote_bits << shift) | (1 << (shift - 1))) & 0xFFFFFFFF if shift <= ACK_WINDOW else 0
+            if self.remote_seq == 0: self.remote_bits = 0
+            self.remote_seq = seq
+        else:
+            stale = True
+            self.stats["stale"] += 1
+            diff = self.remote_seq - seq
+            if 0 < diff <= ACK_WINDOW: self.remote_bits |= 1 << (diff - 1)
+
+        # 2. Подтверждения наших датаграмм
+        acked = [ack] + [ack - i - 1 for i in range(ACK_WINDOW) if ack_bits & (1 << i)]
+        for s in acked:
+            entry = self.in_flight.pop(s, None)
+            if entry is None: continue
+            sent_at, msg_ids = entry
+            if s == ack:
+                sample = now - sent_at
+                self.rtt = sample if self.rtt is None else self.rtt + (sample - self.rtt) * 0.1
+            for msg_id in msg_ids:
+                self.outgoing.pop(msg_id, None)
+
+        # 3. Надежные сообщения - строго по порядку id, без дублей
+        delivered = []
+        for msg_id, body in messages:
+            if msg_id == self.expected_id or _id_newer(msg_id, self.expected_id):
+                self.early[msg_id] = body
+        while self.expected_id in self.early:
+            delivered.append(self.early.pop(self.expected_id))
+            self.expected_id = (self.expected_id + 1) & 0xFFFF
+
+        return kind, payload, delivered, stale
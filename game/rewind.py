@@ -0,0 +1,92 @@
+import math
+import numpy as np
+
+# --- ИСТОРИЯ ПОЗИЦИЙ ДЛЯ КОМПЕНСАЦИИ ЗАДЕРЖКИ ---
+# Стрелок видит чужих игроков в прошлом: на RTT плюс задержку интерполяции.
+# Сервер хранит кольцо последних тиков (строка - тик, столбец - игрок) и
+# проверяет попадание, о котором сообщил клиент, "отмотав" цель в тот тик.
+# Массивы выделены заранее: запись тика - присваивание по строке,
+# отмотка - индексация по нескольким строкам одного столбца.
+
+HISTORY_SECONDS = 1.0   # глубже не отматываем: с таким пингом попадание не засчитывается
+INITIAL_COLUMNS = 64
+
+
+class PositionHistory:
+    """Прямоугольники игроков и их уязвимость (жив, без щита) за последние тики"""
+
+    def __init__(self, tick_rate, seconds=HISTORY_SECONDS, columns=INITIAL_COLUMNS):
+        self.size = math.ceil(tick_rate * seconds) + 1
+        self.ticks = np.full(self.size, -1, np.int64)  # какой тик лежит в строке
+        self.x = np.zeros((self.size, columns))
+        self.y = np.zeros((self.size, columns))
+        self.hittable = np.zeros((self.size, columns), np.bool_)
+        self.w = np.zeros(columns)
+        self.h = np.zeros(columns)
+        self.columns = {}  # id игрока -> столбец
+        self.free = list(range(columns - 1, -1, -1))
+
+    def _grow(self):
+        old = len(self.w)
+        for name in ("x", "y", "hittable"):
+            arr = getattr(self, name)
+            grown = np.zeros((self.size, old * 2), arr.dtype)
+            grown[:, :old] = arr
+            setattr(self, name, grown)
+        for name in ("w", "h"):
+            grown = np.zeros(old * 2)
+            grown[:old] = getattr(self, name)
+            setattr(self, name, grown)
+        self.free.extend(range(old * 2 - 1, old - 1, -1))
+
+    def _column(self, p):
+        col = self.columns.get(p.id)
+        if col is None:
+            if not self.free: self._grow()
+            col = self.columns[p.id] = self.free.pop()
+            self.hittable[:, col] = False  # прошлое прежнего владельца столбца
+        self.w[col], self.h[col] = p.width, p.height
+        return col
+
+    def forget(self, p_id):
+        """Игрок ушел - столбец освобождается"""
+        col = self.columns.pop(p_id, None)
+        if col is not None: self.free.append(col)
+
+    def record(self, tick, players):
+        """Положение игроков после симуляции тика tick (затирает самую старую строку)"""
+        row = tick % self.size
+        self.ticks[row] = tick
+        self.hittable[row] = False
+        cols, xs, ys, ok = [], [], [], []
+        for p in players:
+            cols.append(self._column(p))
+            xs.append(p.rect.x)
+            ys.append(p.rect.y)
+            ok.append(p.hp > 0 and p.abilities["shield"].duration <= 0)
+        if not cols: return
+        self.x[row, cols] = xs
+        self.y[row, cols] = ys
+        self.hittable[row, cols] = ok
+
+    def rows(self, ticks):
+        """Строки тех тиков из ticks, что еще в истории"""
+        return [t % self.size for t in ticks if t >= 0 and self.ticks[t % self.size] == t]
+
+    def first_hit(self, p_id, ticks, xs, ys, half):
+        """Индекс точки из (xs, ys), чей квадрат со стороной 2*half задевает
+        уязвимого игрока p_id хоть в один из тиков ticks (ближайшей к его центру).
+        None - ни одна не задевает или этих тиков уже нет в истории"""
+        col = self.columns.get(p_id)
+        rows = self.rows(ticks)
+        if col is None or not rows or not len(xs): return None
+        rows = [r for r in rows if self.hittable[r, col]]
+        if not rows: return None
+        # Точки по строкам, прямоугольники по столбцу: (точки, тики)
+        px, py = self.x[rows, col], self.y[rows, col]
+        w, h = self.w[col], self.h[col]
+        xs, ys = np.asarray(xs)[:, None], np.asarray(ys)[:, None]
+        hit = (px < xs + half) & (xs - half < px + w) & (py < ys + half) & (ys - half < py + h)
+        d2 = np.where(hit, (xs - px - w / 2) ** 2 + (ys - py - h / 2) ** 2, np.inf).min(axis=1)
+        best = int(np.argmin(d2))
+        return best if np.isfinite(d2[best]) else None
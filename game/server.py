@@ -1,334 +1,931 @@
 import socket
-from _thread import *
-import threading
+import asyncio
+import heapq
+import math
 import pickle
+import selectors
 import time
 import random
 import pygame
-import struct
 import sys
-from player import Player, Bot, Wall
+from player import Player, Bot, Wall, BULLET_RATE
+import protocol
+import reliable
+from framing import FrameReader, FrameError, FrameCompressor, pack_frame
+from spatial import SpatialGrid, BoxGrid
+from ballistics import BulletStore, BULLET_HALF
+from rewind import PositionHistory
+from perception import nearest_targets, nearest_distance
+from interpolation import INTERP_DELAY
 
 # Константы
 MAP_WIDTH = 2000
 MAP_HEIGHT = 2000
 WALL_WIDTH = 100
 WALL_HEIGHT = 10
+GAME_PORT = 5555 # TCP и UDP
 BROADCAST_PORT = 5556
 MAGIC_MESSAGE = b"NEON_DISCOVERY"
+STATS_INTERVAL = 10.0 # Как часто печатать задержки соединений (сек)
+UDP_ENABLED = True    # Снапшоты и ввод по UDP; TCP остается запасным каналом
+COMPRESSION_ENABLED = True # zlib для больших TCP-кадров, если клиент предложил в INIT
 
-data_lock = threading.Lock()
+# Ограничение ресурсов: лимит соединений, очередь accept под наплыв подключений
+# и сроки, после которых соединение закрывается (проверяет reaper_loop).
+# Клиент шлет ввод каждый кадр, а в простое - пустой пакет раз в секунду (network.py)
+MAX_CONNECTIONS = 32
+LISTEN_BACKLOG = 64
+INIT_TIMEOUT = 5.0         # сек от подключения до INIT
+IDLE_TIMEOUT = 10.0        # сек без единого пакета (TCP или UDP)
+WRITE_TIMEOUT = 10.0       # сек, которые запись может стоять на паузе
+LAG_TIMEOUT = 5.0          # сек снапшотов без подтверждения
+REAP_INTERVAL = 1.0
+
+# Обратное давление: буфер записи выше HIGH - транспорт ставит запись на паузу
+# (pause_writing). Пока пауза, снапшоты не кодируются: в слоте лежит только
+# последний мир тика, он уйдет при resume_writing. Медленный клиент не копит
+# память и не тратит CPU тика остальных
+WRITE_HIGH_WATER = 256 * 1024
+WRITE_LOW_WATER = 64 * 1024
+
+# Частота тика сервера: 20/30/60 Гц. Каждый тик - шаг симуляции и один снапшот каждому клиенту
+TICK_RATE = 30
+# Шаг, под который подобраны скорости ботов, пуль и таймеры способностей (сек)
+BASE_DT = 0.03
+# Клиент шлет команду ввода на кадр (BULLET_RATE в секунду), и каждая двигает
+# игрока на шаг. За тик применяется не больше, чем прошло кадров, с запасом
+# на дрожание часов клиента: остальные ждут следующих тиков в inbox. Больше
+# MAX_QUEUED_INPUTS в очереди не копим - лишние команды отбрасываются
+INPUT_RATE_SLACK = 1.1
+INPUT_BURST = 2                # столько команд сверх нормы можно накопить в простое
+MAX_QUEUED_INPUTS = BULLET_RATE
+
+# Область интереса: клиент получает сущности только в этом радиусе от себя (px).
+# Чуть больше половины диагонали экрана, чтобы никто не "выпрыгивал" у края.
+# Таблица счета (ростер) приходит для всех игроков независимо от радиуса.
+AOI_RADIUS = 1200
+AOI_CELL = 300
+
+# Клетка сетки столкновений (px): порядка размера игрока и стены, так что пуля
+# смотрит 1-4 клетки и несколько объектов в них, а не все стены и всех игроков
+COLLISION_CELL = 100
+# Подшаг полета пули (px). За тик 20-30 Гц пуля пролетает 30-45 px и проскочила бы
+# стену насквозь (перекрытие - WALL_HEIGHT + пуля, 20 px). 15 px - как за кадр у клиента
+BULLET_SUBSTEP = 15
+
+# Уровни детализации ИИ ботов: период обновления в тиках по ярусам. Ярус 0 - бот
+# с целью или ближе LOD_NEAR к человеку (на экране 1280x720 с запасом, и это же
+# радиус обзора бота), 1 - ближе LOD_MID, 2 - дальше.
+# Пропущенные тики бот отрабатывает одним шагом на все сразу (движение, перезарядка)
+AI_TIERS = (1, 4, 8)
+LOD_NEAR = 800
+LOD_MID = 1600
+
+# Компенсация задержки: попадание, о котором сообщил клиент, засчитывается, если
+# пуля стрелка задевает цель там, где та была в тик, который стрелок видел на экране
+# (RTT + задержка интерполяции назад). Урон сервер берет свой, а не из пакета
+BULLET_DAMAGE = 10
+REWIND_SLACK_TICKS = 1   # тиков в обе стороны от оценки: дрожание пинга и кадра
+HIT_SLACK = 10           # px к пуле: у клиента она на долю кадра впереди или позади
+
+# Бюджет исходящего трафика снапшотов на клиента (байт/с). Клиент на слабом канале
+# может попросить меньше в INIT ("rate"). Не влезшие изменения сущностей ждут
+# следующих тиков по очереди приоритетов (см. protocol.DeltaEncoder.encode)
+BANDWIDTH_LIMIT = 64 * 1024
+MIN_BANDWIDTH = 4 * 1024
+SELF_PRIORITY = 1000.0 # свой игрок нужен клиенту для сверки предсказания каждый тик
 
 # Глобальные переменные сервера
 players = {}
 chat_log = []
+chat_seq = 0 # Сколько сообщений добавлено за все время (chat_log обрезается)
 static_entities = {}
+wall_expiry = [] # куча (тик исчезновения, id стены)
 current_id = 0
 wall_id_counter = 0
+bullet_id_counter = 0
+event_log = protocol.EventLog()  # появление/попадание пуль - вместо их позиций в снапшоте
+bullet_store = BulletStore()     # все летящие пули сервера (массивы NumPy)
+lag_history = PositionHistory(TICK_RATE)  # где были игроки в последние тики
+hit_stats = {"confirmed": 0, "rejected": 0}
+ai_schedule = {}  # id бота -> [тик последнего ИИ, была ли у него цель]
+# Боты по ярусам в последнем тике, время ИИ яруса за тик и прохода восприятия (скользящее среднее)
+ai_stats = {"bots": [0] * len(AI_TIERS), "ms": [None] * len(AI_TIERS), "perception_ms": None}
 server_running = False
+connections = set()
+udp_tokens = {}  # токен UDP-канала -> ClientConnection
+game_udp = None  # UDP-транспорт игрового порта
+aoi_grid = SpatialGrid(AOI_CELL)  # центры игроков, перестраивается раз за тик
+wall_grid = BoxGrid(COLLISION_CELL)  # стены: добавляются и убираются вместе со static_entities
+body_grid = BoxGrid(COLLISION_CELL)  # игроки: перестраивается в начале симуляции, боты - по ходу
 
-def reset_server_state():
-    global players, chat_log, static_entities, current_id, wall_id_counter, server_running
+def reset_server_state(tick_rate=TICK_RATE):
+    global players, chat_log, chat_seq, static_entities, current_id, wall_id_counter, server_running, connections, udp_tokens, aoi_grid
+    global bullet_id_counter, event_log, wall_expiry, wall_grid, body_grid, bullet_store, lag_history, ai_schedule
     players = {}
+    aoi_grid = SpatialGrid(AOI_CELL)
+    wall_grid = BoxGrid(COLLISION_CELL)
+    body_grid = BoxGrid(COLLISION_CELL)
+    connections = set()
+    udp_tokens = {}
     chat_log = ["Сервер запущен!", "Напиши /bot для врагов"]
+    chat_seq = len(chat_log)
     static_entities = {}
+    wall_expiry = []
     current_id = 0
     wall_id_counter = 0
+    bullet_id_counter = 0
+    event_log = protocol.EventLog()
+    bullet_store = BulletStore()
+    lag_history = PositionHistory(tick_rate)
+    hit_stats.update(confirmed=0, rejected=0)
+    ai_schedule = {}
+    ai_stats.update(bots=[0] * len(AI_TIERS), ms=[None] * len(AI_TIERS), perception_ms=None)
     server_running = True
 
-def udp_broadcast_listener():
+def post_chat(msg):
+    """Добавляет сообщение в чат, храня только последние 20"""
+    global chat_seq
+    chat_log.append(msg)
+    chat_seq += 1
+    if len(chat_log) > 20: chat_log.pop(0)
+
+def chat_since(seq):
+    """Сообщения, появившиеся после chat_seq == seq"""
+    new_count = min(chat_seq - seq, len(chat_log))
+    return chat_log[-new_count:] if new_count > 0 else []
+
+def _ewma(old, sample, k=0.1):
+    return sample if old is None else old + (sample - old) * k
+
+class DiscoveryProtocol(asyncio.DatagramProtocol):
     """Слушает широковещательные запросы и отвечает на них"""
-    udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        udp_sock.bind(('', BROADCAST_PORT))
-    except Exception as e:
-        print(f"[UDP] Ошибка бинда порта обнаружения: {e}")
-        return
 
-    print("[UDP] Сервер обнаружения активен")
-    
-    while server_running:
+    def connection_made(self, transport):
+        self.transport = transport
+        print("[UDP] Сервер обнаружения активен")
+
+    def datagram_received(self, data, addr):
+        if data == MAGIC_MESSAGE:
+            # ФИЛЬТР: Считаем только реальных игроков (не ботов)
+            real_players_count = len([p for p in players.values() if not isinstance(p, Bot)])
+            
+            # Отвечаем: NEON_SERVER|ServerName|PlayerCount
+            response = f"NEON_SERVER|Neon Arena|{real_players_count}".encode('utf-8')
+            self.transport.sendto(response, addr)
+
+    def error_received(self, exc):
+        if server_running: print(f"[UDP Error] {exc}")
+
+class GameDatagramProtocol(asyncio.DatagramProtocol):
+    """Игровой UDP: ввод и надежные события от клиентов (см. reliable.py)"""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
         try:
-            udp_sock.settimeout(2.0)
-            try:
-                data, addr = udp_sock.recvfrom(1024)
-            except socket.timeout:
-                continue
-                
-            if data == MAGIC_MESSAGE:
-                # ФИЛЬТР: Считаем только реальных игроков (не ботов)
-                real_players_count = len([p for p in players.values() if not isinstance(p, Bot)])
-                
-                # Отвечаем: NEON_SERVER|ServerName|PlayerCount
-                response = f"NEON_SERVER|Neon Arena|{real_players_count}".encode('utf-8')
-                udp_sock.sendto(response, addr)
-        except Exception as e:
-            if server_running: print(f"[UDP Error] {e}")
-    
-    udp_sock.close()
+            _, kind, token = reliable.peek_header(data)
+        except reliable.ChannelError:
+            return
+        conn = udp_tokens.get(token)
+        if conn is None: return
+        try:
+            kind, payload, messages, stale = conn.channel.receive(data)
+        except reliable.ChannelError:
+            return
+        conn.stats["bytes_in"] += len(data)
+        # Адрес может смениться (NAT) - токен важнее
+        if conn.udp_addr != addr:
+            if conn.udp_addr is None: print(f"[UDP] #{conn.player_id} канал {addr}")
+            conn.udp_addr = addr
+        conn.last_recv = time.perf_counter()
 
-def bot_simulation_thread():
-    global static_entities
-    while server_running:
+        if kind == reliable.KIND_HELLO:
+            self.transport.sendto(conn.channel.build(reliable.KIND_HELLO), addr)
+            return
         try:
-            time.sleep(0.03)
-            current_players_list = list(players.items())
-            
-            for p_id, p in current_players_list:
-                if p_id not in players: continue 
-                
-                p.abilities["shield"].update()
-                p.abilities["wall"].update()
-
-                if isinstance(p, Bot):
-                    p.ai_move(players, MAP_WIDTH, MAP_HEIGHT)
-                
-                bullets_to_remove = []
-                for bullet in p.bullets:
-                    b_rect = pygame.Rect(bullet[0]-5, bullet[1]-5, 10, 10)
-                    wall_hit = False
-                    for wall in static_entities.values():
-                        if b_rect.colliderect(wall.rect):
-                            bullets_to_remove.append(bullet)
-                            wall_hit = True
-                            break
-                    if wall_hit: continue
-
-                    if isinstance(p, Bot): 
-                        for target_id, target in players.items():
-                            if target_id != p_id and target.hp > 0 and target.abilities["shield"].duration <= 0:
-                                if b_rect.colliderect(target.rect):
-                                    bullets_to_remove.append(bullet)
-                                    target.hp -= 10
-                                    if target.hp <= 0:
-                                        p.kills += 1
-                                        target.deaths += 1
-                                        chat_log.append(f"[KILL] {p.nickname} уничтожил {target.nickname}!")
-                                    break
-                
-                for b in bullets_to_remove:
-                    if b in p.bullets: p.bullets.remove(b)
-                
+            for body in messages:
+                conn.handle_events(pickle.loads(body))
+            # Старые команды отсеет seq - stale-датаграмму не выбрасываем целиком
+            if kind == reliable.KIND_INPUT and payload:
+                conn.handle_input(payload)
         except Exception as e:
-            print(f"[BOT THREAD ERROR]: {e}")
+            print(f"[UDP {conn.player_id}] {e}")
 
-def server_works():
-    """Очистка старых стен"""
-    walls_to_remove = []
-    for w_id, wall in static_entities.items():
-        if time.time() - wall.created_time >= Wall.WALL_DURATION:
-            walls_to_remove.append(w_id)
-    for w_id in walls_to_remove:
-        del static_entities[w_id]
+    def error_received(self, exc):
+        if server_running: print(f"[UDP Error] {exc}")
 
-def threaded_client(conn, player_id):
-    global chat_log, current_id, static_entities, wall_id_counter
+def simulate_world(step=1):
+    """Один шаг симуляции: способности, ИИ ботов, полет пуль, попадания пуль ботов.
+    step - длительность тика в единицах BASE_DT"""
+    tick = tick_stats["tick"]
+    current_players_list = list(players.items())
 
-    last_chat_index = len(chat_log)
-    
-    # conn.send(pickle.dumps(players[player_id]))
-    with data_lock:
-        initial_data = pickle.dumps(players[player_id])
-    conn.send(initial_data)
+    # Восприятие ботов, чья очередь по ярусу, - одним проходом по положениям на начало тика
+    started = time.perf_counter()
+    bots = [p for p in players.values() if isinstance(p, Bot)]
+    for bot in bots: bot.revive(MAP_WIDTH, MAP_HEIGHT)
+    due = schedule_bots(bots, tick)
+    seen = nearest_targets([bot for bot in bots if bot.id in due], list(players.values()))
+    ai_stats["perception_ms"] = _ewma(ai_stats["perception_ms"], (time.perf_counter() - started) * 1000)
+    body_grid.rebuild((p_id, *p.rect) for p_id, p in current_players_list)
+    tier_ms = [0.0] * len(AI_TIERS)
     
+    for p_id, p in current_players_list:
+        if p_id not in players: continue 
+        
+        p.abilities["shield"].update(step)
+        p.abilities["wall"].update(step)
+
+        tier = due.get(p_id)
+        if tier is not None:
+            started = time.perf_counter()
+            state = ai_schedule[p_id]
+            ai_step = step * min(tick - state[0], AI_TIERS[-1])
+            state[0] = tick
+            p.ai_move(players, MAP_WIDTH, MAP_HEIGHT, ai_step, seen=seen[p_id])
+            state[1] = seen[p_id][0] is not None
+            body_grid.insert(p_id, *p.rect)
+            tier_ms[tier] += (time.perf_counter() - started) * 1000
+    ai_stats["ms"] = [_ewma(old, new) for old, new in zip(ai_stats["ms"], tier_ms)]
+
+    # Пули - все разом в bullet_store. Новые (Player.shoot кладет их в p.bullets)
+    # в тик выстрела не летят, но столкновения проверяются и для них.
+    # Путь за тик режется на подшаги не длиннее BULLET_SUBSTEP
+    for p_id, p in current_players_list: spawn_pending(p, tick)
+    bullet_step = step * BASE_DT * BULLET_RATE
+    substeps = max(1, math.ceil(bullet_store.max_speed() * bullet_step / BULLET_SUBSTEP))
+    for _ in range(substeps):
+        bullet_store.advance(bullet_step / substeps, tick)
+        collide_bullets()
+
+def collide_bullets():
+    """Пули за краем карты, в стенах и попадания пуль ботов - в текущих позициях"""
+    for slot in bullet_store.outside(-100, -100, MAP_WIDTH + 100, MAP_HEIGHT + 100):
+        remove_bullet(slot)
+    for slot in bullet_store.touching(wall_grid.cells, COLLISION_CELL):
+        if hits_wall(bullet_rect(slot)): remove_bullet(slot)
+
+    # Попадания пуль людей присылают их клиенты (handle_update)
+    for slot in bullet_store.touching(body_grid.cells, COLLISION_CELL, bots_only=True):
+        p = players.get(int(bullet_store.owner[slot]))
+        if p is None: continue
+        target_id = bullet_target(p.id, bullet_rect(slot))
+        if target_id is None: continue
+        target = players[target_id]
+        remove_bullet(slot, target_id)
+        target.hp -= BULLET_DAMAGE
+        if target.hp <= 0:
+            p.kills += 1
+            target.deaths += 1
+            post_chat(f"[KILL] {p.nickname} уничтожил {target.nickname}!")
+
+def schedule_bots(bots, tick):
+    """Ярус каждого бота по расстоянию до ближайшего человека и наличию цели.
+    -> {id бота: ярус} тех, кому пора обновить ИИ в этот тик. Новый бот
+    начинает со сдвигом по id, чтобы боты одного яруса не шли одним тиком"""
+    humans = [p for p in players.values() if not isinstance(p, Bot)]
+    counts = [0] * len(AI_TIERS)
+    due = {}
+    for bot, dist in zip(bots, nearest_distance(bots, humans).tolist()):
+        if bot.id not in ai_schedule: ai_schedule[bot.id] = [tick - 1 - bot.id % AI_TIERS[-1], False]
+        last, engaged = ai_schedule[bot.id]
+        if engaged or dist < LOD_NEAR: tier = 0
+        elif dist < LOD_MID: tier = 1
+        else: tier = 2
+        counts[tier] += 1
+        if tick - last >= AI_TIERS[tier]: due[bot.id] = tier
+    ai_stats["bots"] = counts
+    return due
+
+def bullet_rect(slot):
+    return pygame.Rect(bullet_store.x[slot] - 5, bullet_store.y[slot] - 5, 10, 10)
+
+def hits_wall(rect):
+    """Задевает ли прямоугольник какую-нибудь стену (кандидаты - из wall_grid)"""
+    for w_id in wall_grid.query_box(*rect):
+        wall = static_entities.get(w_id)
+        if wall is not None and rect.colliderect(wall.rect): return True
+    return False
+
+def bullet_target(owner_id, rect):
+    """Живой игрок без щита, в которого попадает пуля owner_id, или None.
+    Кандидаты - из body_grid, при нескольких - младший id"""
+    for target_id in sorted(body_grid.query_box(*rect)):
+        if target_id == owner_id: continue
+        target = players.get(target_id)
+        if target is None or target.hp <= 0 or target.abilities["shield"].duration > 0: continue
+        if rect.colliderect(target.rect): return target_id
+    return None
+
+def spawn_bullet(p, bullet, tick):
+    """Выстрел [x, y, vx, vy] -> новая пуля в bullet_store и событие появления.
+    Сервер ведет пулю по квантованным точке и скорости - так же, как ее посчитают клиенты"""
+    global bullet_id_counter
+    bullet_id_counter += 1
+    x, y, vx, vy = event_log.spawn(bullet_id_counter, p.id, tick, *bullet[:4])
+    bullet_store.add(bullet_id_counter, p.id, tick, x, y, vx, vy, bot=isinstance(p, Bot))
+
+def spawn_pending(p, tick):
+    """Выстрелы игрока, сделанные с прошлого тика -> летящие пули"""
+    for bullet in p.bullets: spawn_bullet(p, bullet, tick)
+    p.bullets.clear()
+
+def remove_bullet(slot, target_id=None):
+    """Убирает пулю; клиентам - событие попадания в target_id или исчезновения"""
+    if not bullet_store.alive[slot]: return
+    bullet_id = int(bullet_store.bullet_id[slot])
+    bullet_store.kill(slot)
+    if target_id is None: event_log.despawn(bullet_id, tick_stats["tick"])
+    else: event_log.hit(bullet_id, tick_stats["tick"], target_id)
+
+def drop_bullets(p):
+    p.bullets.clear() # еще не вылетевшие - клиенты о них не знают
+    for slot in bullet_store.of_owner(p.id): remove_bullet(slot)
+
+# phase_ms - время фаз тика (скользящее среднее), busy_ms - сумма времени всех тиков:
+# остальное процессорное время цикла - прием и разбор пакетов
+tick_stats = {"tick": 0, "tick_ms": None, "overruns": 0, "rate": TICK_RATE,
+              "phase_ms": {"input": None, "sim": None, "send": None}, "busy_ms": 0.0}
+
+def _phase(name, started):
+    now = time.perf_counter()
+    tick_stats["phase_ms"][name] = _ewma(tick_stats["phase_ms"][name], (now - started) * 1000)
+    return now
+
+def server_tick(step):
+    """Входящие пакеты -> симуляция -> по снапшоту каждому клиенту"""
+    started = time.perf_counter()
+    # 1. Ввод клиентов, накопленный с прошлого тика (команды и события по порядку)
+    # Плохой пакет закрывает только свое соединение (как в buffer_updated), а inbox
+    # забирается до разбора: иначе он упадет на том же месте и в следующем тике
+    per_tick = BULLET_RATE / tick_stats["rate"] * INPUT_RATE_SLACK
+    for conn in list(connections):
+        inbox, conn.inbox = conn.inbox, []
+        conn.input_credit = min(conn.input_credit + per_tick, per_tick + INPUT_BURST)
+        for i, item in enumerate(inbox):
+            try:
+                if isinstance(item, tuple):
+                    # Команда ввода: сверх нормы тика - ждет в inbox вместе со всем, что после нее
+                    if conn.input_credit < 1:
+                        conn.inbox = inbox[i:]
+                        break
+                    conn.input_credit -= 1
+                    cmd, received = item
+                    apply_input(conn.player_id, cmd)
+                    conn.queued_inputs -= 1
+                    # В снапшот - последняя примененная команда и сколько она ждала
+                    conn.client_seq, conn.client_seq_time = cmd.seq, received
+                else: handle_update(conn.player_id, item)
+            except Exception as e:
+                print(f"[CLIENT {conn.player_id}] {e}")
+                conn.transport.close()
+                break
+    started = _phase("input", started)
+
+    # 2. Симуляция
+    simulate_world(step)
+    expire_walls(tick_stats["tick"])
+    players_list = list(players.values())
+    lag_history.record(tick_stats["tick"], players_list)
+    started = _phase("sim", started)
+
+    # 3. Рассылка: мир тика и индекс строятся один раз, дальше каждому - только его окрестность
+    frame = world_frame(players_list)
+    aoi_grid.rebuild((p.id, p.x + p.width / 2, p.y + p.height / 2) for p in players_list)
+    for conn in list(connections):
+        if conn.ready: conn.send_snapshot(frame, weights=interest_weights(conn.player_id))
+    _phase("send", started)
+
+def world_frame(players_list=None):
+    """Состояние мира на этот тик - сериализуется один раз на всех клиентов"""
+    if players_list is None: players_list = list(players.values())
+    return protocol.WorldFrame(players_list, list(static_entities.values()), tick_stats["tick"])
+
+def interest_weights(player_id):
+    """Игроки в области интереса (включая его самого) -> вес для очереди
+    приоритетов: ближние важнее дальних"""
+    me = players.get(player_id)
+    if me is None: return {player_id: SELF_PRIORITY}
+    cx, cy = me.x + me.width / 2, me.y + me.height / 2
+    weights = {}
+    for p_id in aoi_grid.query_radius(cx, cy, AOI_RADIUS):
+        px, py = aoi_grid.positions[p_id]
+        weights[p_id] = max(0.1, 1.0 - math.hypot(px - cx, py - cy) / AOI_RADIUS)
+    weights[player_id] = SELF_PRIORITY
+    return weights
+
+async def tick_loop(tick_rate):
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / tick_rate
+    step = interval / BASE_DT
+    next_tick = loop.time()
     while server_running:
+        started = time.perf_counter()
         try:
-            # data = pickle.loads(conn.recv(4096*32))
-            # if not data: break
-            
-            header = conn.recv(4)
-            if not header: break
-            
-            msg_len = struct.unpack('>I', header)[0]
-            
-            # 2. Читаем сами данные
-            chunks = []
-            bytes_recd = 0
-            while bytes_recd < msg_len:
-                chunk = conn.recv(min(msg_len - bytes_recd, 8192))
-                if not chunk: break
-                chunks.append(chunk)
-                bytes_recd += len(chunk)
-            
-            data = pickle.loads(b''.join(chunks))
-            
-            if isinstance(data, dict) and data.get("type") == "INIT":
-                players[player_id].skin_id = data.get("skin", "DEFAULT")
-                players[player_id].nickname = data.get("nick", f"Player {player_id}")
-                # p_obj = data.get("player")
-                reply = {"players": players, "chat": chat_log, "walls": static_entities}
-                conn.sendall(pickle.dumps(reply))
-                continue
-            
-            # if isinstance(data, dict) and data.get("type") == "ONLYPLAYER":
-            #     p_obj = data.get("player")
-            #     new_msg = None
-            #     hit_data = data.get("hits", [])
-            #     ability_cast = None
-            #     # print("ONLYPLAYER received")
-
-            # if isinstance(data, dict) and data.get("type") == "FULLPACKET":
-            #     p_obj = data.get("player")
-            #     new_msg = data.get("msg")
-            #     hit_data = data.get("hits", [])
-            #     ability_cast = data.get("ability_cast")
-            #     print("FULLPACKET received")
-            #     print(hit_data)
-            #     continue
-            
-            if isinstance(data, dict) and data.get("type") == "UPDATE":
-                p_obj = data.get("player")
-                
-                # Инициализируем переменные, которые могут отсутствовать в пакете
-                new_msg = None
-                hit_data = []
-                ability_cast = None
-
-                # Проверяем, есть ли дополнительные данные, используя .get() или "in dict"
-                
-                # 1. Получаем hit_data (если есть)
-                if "hits" in data:
-                    hit_data = data["hits"]
-                    # print("Received hits data:", hit_data) # Отладка: должно срабатывать при выстреле
-
-                # 2. Получаем сообщение (если есть)
-                if "msg" in data:
-                    new_msg = data["msg"]
-                    # Здесь должна быть логика добавления new_msg в chat_log
-
-                # 3. Получаем способность (если есть)
-                if "ability_cast" in data:
-                    ability_cast = data["ability_cast"]
-                
-                client_ping = data.get("ping", 0)
-        
-            # p_obj = data.get("player")
-            # new_msg = data.get("msg")
-            # hit_data = data.get("hits", []) 
-            # ability_cast = data.get("ability_cast")
-            
-            if p_obj and player_id in players:
-                current_hp = players[player_id].hp
-                current_abilities = players[player_id].abilities
-                players[player_id] = p_obj 
-                players[player_id].hp = current_hp
-                players[player_id].abilities = current_abilities
-                
-                current_kills = players[player_id].kills
-                current_deaths = players[player_id].deaths
-                
-                players[player_id] = p_obj 
-                players[player_id].kills = current_kills
-                players[player_id].deaths = current_deaths
-                players[player_id].ping = client_ping
-                
-                players[player_id].update_rect()
-                
-                server_works() # Проверка стен
-                
-                if p_obj.hp <= 0:
-                    players[player_id].x = random.randint(100, MAP_WIDTH - 100)
-                    players[player_id].y = random.randint(100, MAP_HEIGHT - 100)
-                    p_obj.respawn(MAP_WIDTH, MAP_HEIGHT)
-
-            for hit in hit_data:
-                target_id = hit["target_id"]
-                if target_id in players:
-                    target = players[target_id]
-                    # if target.abilities["shield"].duration > 0:
-                    #     continue 
-                    target.hp -= hit["damage"]
-                    if target.hp <= 0:
-                        players[player_id].kills += 1
-                        target.deaths += 1
-                        chat_log.append(f"[KILL] {players[player_id].nickname} -> {target.nickname}")
-
-            if ability_cast and player_id in players:
-                ability_key = ability_cast["key"]
-                
-                if ability_key == "wall":
-                    # Activation: Tries to activate ability on server
-                    if players[player_id].abilities["wall"].activate(players[player_id]):
-                        wall_id_counter += 1
-                        # Wall spawns at player's current location (center)
-                        w_x = players[player_id].x + players[player_id].width//2 - WALL_WIDTH//2 # assuming WALL_WIDTH is defined in Wall class
-                        w_y = players[player_id].y + players[player_id].height + 5 # Spawn slightly in front
-                        static_entities[wall_id_counter] = Wall(w_x, w_y, wall_id_counter)
-                        chat_log.append(f"[ABILITY] {players[player_id].nickname} создал СТЕНУ!")
-                
-                elif ability_key == "shield":
-                    players[player_id].abilities["shield"].activate(players[player_id])
-                    
-            if new_msg:
-                if new_msg.startswith("/bot"):
-                    msgCount = new_msg.split()
-                    count = int(msgCount[1]) if len(msgCount) > 1 else 1
-                    for _ in range(count):
-                        bot_id = current_id + 1000
-                        current_id += 1
-                        players[bot_id] = Bot(random.randint(100,1000), random.randint(100,1000), 50, 50, (255,0,0), bot_id)
-                        chat_log.append(f"[SERVER] Бот создан!")
-                else:
-                    chat_log.append(f"{players[player_id].nickname}: {new_msg}")
-                if len(chat_log) > 20: chat_log.pop(0)
-                
-            with data_lock:
-                reply = {"players": players, "walls": static_entities}
-            
-            current_chat_len = len(chat_log)
-            new_messages_count = current_chat_len - last_chat_index
-                
-            if new_messages_count > 0:
-                # Отправляем только новые сообщения
-                reply["chat"] = chat_log[last_chat_index:]
-                # Обновляем индекс для следующего кадра
-                last_chat_index = current_chat_len
-
-            # reply = {"players": players, "chat": chat_log, "walls": static_entities}
-            # conn.sendall(pickle.dumps(reply))
-            reply_serialized = pickle.dumps(reply)
-            reply_len = struct.pack('>I', len(reply_serialized))
-            conn.sendall(reply_len + reply_serialized)
-            
+            server_tick(step)
         except Exception as e:
-            break
+            print(f"[TICK ERROR]: {e}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        tick_stats["tick"] += 1
+        tick_stats["tick_ms"] = _ewma(tick_stats["tick_ms"], elapsed_ms)
+        tick_stats["busy_ms"] += elapsed_ms
 
-    if player_id in players: del players[player_id]
-    conn.close()
+        next_tick += interval
+        delay = next_tick - loop.time()
+        if delay < 0:
+            # Не успели - не пытаемся догонять пачкой тиков
+            tick_stats["overruns"] += 1
+            next_tick = loop.time()
+            delay = 0
+        await asyncio.sleep(delay)
 
-def start_server_instance(bind_ip="0.0.0.0"):
-    """Основная функция запуска сервера"""
-    global current_id, server_running
-    
-    reset_server_state()
-    
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    
+def expire_walls(tick):
+    """Убирает стены, срок которых наступил к тику tick. Смотрит только
+    вершину кучи - остальные стены не трогаются"""
+    while wall_expiry and wall_expiry[0][0] <= tick:
+        _, w_id = heapq.heappop(wall_expiry)
+        static_entities.pop(w_id, None)
+        wall_grid.remove(w_id)
+
+def handle_init(player_id, data):
+    players[player_id].skin_id = data.get("skin", "DEFAULT")
+    players[player_id].nickname = data.get("nick", f"Player {player_id}")
+
+def apply_input(player_id, cmd):
+    """Команда ввода клиента: двигает игрока сервер, клиенту не верим"""
+    p = players.get(player_id)
+    if p is None: return
+    if p.hp <= 0:
+        drop_bullets(p)
+        p.x = random.randint(100, MAP_WIDTH - 100)
+        p.y = random.randint(100, MAP_HEIGHT - 100)
+        p.respawn(MAP_WIDTH, MAP_HEIGHT)
+        p.update_rect()
+        return
+    if cmd.buttons & protocol.BTN_SHIELD: cast_ability(player_id, "shield")
+    if cmd.buttons & protocol.BTN_WALL: cast_ability(player_id, "wall")
+    p.apply_input(cmd, MAP_WIDTH, MAP_HEIGHT, bullets=False)
+
+def cast_ability(player_id, ability_key):
+    global wall_id_counter
+    p = players[player_id]
+    if ability_key == "wall":
+        # Activation: Tries to activate ability on server
+        if p.abilities["wall"].activate(p):
+            wall_id_counter += 1
+            # Wall spawns at player's current location (center)
+            w_x = p.x + p.width//2 - WALL_WIDTH//2
+            w_y = p.y + p.height + 5 # Spawn slightly in front
+            wall = Wall(w_x, w_y, wall_id_counter)
+            # Срок - в тиках сервера: клиенты уберут стену сами, без лишних пакетов
+            wall.expire_tick = tick_stats["tick"] + round(Wall.WALL_DURATION * tick_stats["rate"])
+            static_entities[wall_id_counter] = wall
+            wall_grid.insert(wall_id_counter, *wall.rect)
+            heapq.heappush(wall_expiry, (wall.expire_tick, wall_id_counter))
+            post_chat(f"[ABILITY] {p.nickname} создал СТЕНУ!")
+    elif ability_key == "shield":
+        p.abilities["shield"].activate(p)
+
+def view_tick(player):
+    """Тик, который игрок видел на экране, когда отправил сообщение: чужих он
+    рисует на полпути RTT и задержку интерполяции в прошлом, а сообщение идет
+    к нам еще полпути RTT. ping - RTT, измеренный сервером (handle_input)"""
+    rate = tick_stats["rate"]
+    behind = player.ping / 1000 + max(INTERP_DELAY, 2.0 / rate)
+    return tick_stats["tick"] - round(behind * rate)
+
+def confirm_hit(shooter, target_id):
+    """Слот пули shooter, которая задевает target_id в отмотанном к view_tick
+    положении, или None.
+    Где была пуля у клиента: выстрел дошел до нас на полпути RTT позже, чем
+    клиент выстрелил, и отчет о попадании - на столько же позже, чем клиент
+    попал. Значит, у клиента пуля летела столько, сколько тиков прошло от ее
+    появления у нас до этого тика. Это не текущая позиция: advance этого тика
+    еще не было. Оба пакета ждут начала тика, поэтому берется отрезок пути
+    +-REWIND_SLACK_TICKS от этой оценки"""
+    tick = tick_stats["tick"]
+    spawn_pending(shooter, tick) # выстрел и попадание в одном пакете
+    slots = bullet_store.of_owner(shooter.id)
+    if not slots.size: return None
+    per_tick = BULLET_RATE / tick_stats["rate"] # единиц шага advance за тик
+    xs, ys = bullet_store.swept(slots, (tick - bullet_store.spawn_tick[slots]) * per_tick,
+                                REWIND_SLACK_TICKS * per_tick, BULLET_SUBSTEP)
+    t = view_tick(shooter)
+    ticks = range(t - REWIND_SLACK_TICKS, t + REWIND_SLACK_TICKS + 1)
+    best = lag_history.first_hit(target_id, ticks, xs.ravel(), ys.ravel(), BULLET_HALF + HIT_SLACK)
+    return None if best is None else int(slots[best // xs.shape[1]])
+
+def handle_update(player_id, data):
+    """Применяет события клиента (попадания, чат) к состоянию мира"""
+    global current_id
+
+    # Проверяем, есть ли дополнительные данные, используя .get()
+    hit_data = data.get("hits", [])
+    new_msg = data.get("msg")
+    # Пакет пришел от клиента - типы не гарантированы
+    if not isinstance(hit_data, list): hit_data = []
+    if not isinstance(new_msg, str): new_msg = None
+
+    shooter = players.get(player_id)
+    for hit in hit_data:
+        if not isinstance(hit, dict): continue
+        target_id = hit.get("target_id")
+        if not isinstance(target_id, int): continue
+        target = players.get(target_id)
+        if target is None or shooter is None or target_id == player_id or target.hp <= 0: continue
+        # Клиент свою пулю уже удалил - у нас она уходит с событием попадания
+        slot = confirm_hit(shooter, target_id)
+        if slot is None:
+            hit_stats["rejected"] += 1
+            continue
+        hit_stats["confirmed"] += 1
+        remove_bullet(slot, target_id)
+        target.hp -= BULLET_DAMAGE
+        if target.hp <= 0:
+            shooter.kills += 1
+            target.deaths += 1
+            post_chat(f"[KILL] {shooter.nickname} -> {target.nickname}")
+
+    if new_msg and player_id in players:
+        if new_msg.startswith("/bot"):
+            msgCount = new_msg.split()
+            count = int(msgCount[1]) if len(msgCount) > 1 and msgCount[1].isdigit() else 1
+            for _ in range(count):
+                bot_id = current_id + 1000
+                current_id += 1
+                players[bot_id] = Bot(random.randint(100,1000), random.randint(100,1000), 50, 50, (255,0,0), bot_id)
+                post_chat(f"[SERVER] Бот создан!")
+        else:
+            post_chat(f"{players[player_id].nickname}: {new_msg}")
+
+class ClientConnection(asyncio.BufferedProtocol):
+    """Одно TCP-соединение: кадры с 4-байтной длиной, INIT, события и команды ввода.
+    Ввод копится в inbox до тика, снапшоты шлет тик (send_snapshot)"""
+
+    def __init__(self):
+        self.transport = None
+        self.player_id = None
+        self.addr = None
+        self.admitted = False
+        self.reader = FrameReader() # транспорт читает прямо в его буфер
+        self.compressor = None      # FrameCompressor, если клиент умеет zlib
+        self._frame_started = None
+        self.ready = False # После INIT клиент получает снапшоты каждый тик
+        self.inbox = []
+        # UDP-канал: включается, когда клиент пришлет HELLO с этим токеном
+        self.token = random.getrandbits(32) or 1
+        self.channel = reliable.ReliableChannel(self.token)
+        self.udp_addr = None
+        # Сроки: когда подключился, когда последний раз что-то прислал,
+        # с какого момента буфер записи не разгружается
+        self.connected_at = self.last_recv = time.perf_counter()
+        self.write_stalled_since = None # с какого момента запись на паузе
+        self.pending = None             # (мир, чат, веса) снапшота, ждущего resume_writing
+        self.last_chat_seq = chat_seq
+        # Последняя примененная команда клиента - ее seq возвращается для пинга
+        # и сверки предсказания. last_input_seq - последняя принятая (отсев повторов)
+        self.client_seq = 0
+        self.client_seq_time = 0.0
+        self.last_input_seq = 0
+        self.input_credit = 0.0 # сколько команд еще можно применить (см. INPUT_RATE_SLACK)
+        # RTT меряем сами: от отправки снапшота до его ack (и по TCP, и по UDP).
+        # Пингу из пакета клиента не верим - от него зависит глубина отмотки
+        self.snapshot_times = {} # seq снапшота -> когда ушел
+        self.rtt = None          # мс, скользящее среднее
+        self.queued_inputs = 0  # команд в inbox
+        # История отправленных снапшотов этого клиента - шлем только изменения.
+        # События пуль - начиная с самой старой летящей, чтобы новичок видел все
+        self.encoder = protocol.DeltaEncoder(event_seq=event_log.join_seq())
+        self.rate_limit = BANDWIDTH_LIMIT # байт/с
+        self.rate = None                  # фактически отправлено, байт/с (скользящее среднее)
+        # Задержки в мс (скользящее среднее): сборка кадра, обработка, запись в сокет
+        self.stats = {
+            "frames_in": 0, "frames_out": 0, "bytes_in": 0, "bytes_out": 0,
+            "read_ms": None, "proc_ms": None, "write_ms": None, "write_buffer": 0,
+            "replaced": 0, # снапшотов, вытесненных более новым, пока запись стояла
+        }
+
+    def connection_made(self, transport):
+        global current_id
+        self.transport = transport
+        self.addr = transport.get_extra_info("peername")
+        if len(connections) >= MAX_CONNECTIONS:
+            print(f"Отказ {self.addr}: сервер полон ({MAX_CONNECTIONS})")
+            transport.close()
+            return
+        self.admitted = True
+        print(f"Подключился: {self.addr}")
+        # Keepalive ОС - запасной вариант для пропавших без FIN, если клиент старый
+        sock = transport.get_extra_info("socket")
+        if sock is not None: sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        transport.set_write_buffer_limits(high=WRITE_HIGH_WATER, low=WRITE_LOW_WATER)
+        self.player_id = current_id
+        current_id += 1
+        players[self.player_id] = Player(random.randint(100, 800), random.randint(100, 800), 50, 50, (0, 255, 255), self.player_id)
+        connections.add(self)
+        # Первое сообщение без длины - клиент читает его одним recv
+        transport.write(pickle.dumps(players[self.player_id]))
+
+    def connection_lost(self, exc):
+        if not self.admitted: return
+        connections.discard(self)
+        udp_tokens.pop(self.token, None)
+        if self.player_id in players:
+            drop_bullets(players[self.player_id])
+            del players[self.player_id]
+        lag_history.forget(self.player_id)
+
+    def pause_writing(self):
+        self.write_stalled_since = time.perf_counter()
+
+    def resume_writing(self):
+        self.write_stalled_since = None
+        if self.pending is not None:
+            frame, chat, weights = self.pending
+            self.pending = None
+            self.send_snapshot(frame, chat, weights)
+
+    def get_buffer(self, sizehint):
+        return self.reader.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        # Кадры: команды ввода (бинарные, см. protocol.py) или pickle-пакеты INIT/EVENTS
+        if self.reader.start == self.reader.end: self._frame_started = time.perf_counter()
+        self.reader.advance(nbytes)
+        self.stats["bytes_in"] += nbytes
+        self.last_recv = time.perf_counter()
+
+        while True:
+            try:
+                body = self.reader.next_frame()
+            except FrameError as e:
+                print(f"[CLIENT {self.player_id}] {e}")
+                self.transport.close()
+                return
+            if body is None: break
+
+            now = time.perf_counter()
+            self.stats["read_ms"] = _ewma(self.stats["read_ms"], (now - self._frame_started) * 1000)
+            self.stats["frames_in"] += 1
+            self._frame_started = now
+
+            try:
+                if body[0] == protocol.PROTOCOL_VERSION: self.handle_input(body)
+                else: self.handle_packet(pickle.loads(body))
+            except Exception as e:
+                print(f"[CLIENT {self.player_id}] {e}")
+                self.transport.close()
+                return
+
+    def handle_packet(self, data):
+        if not isinstance(data, dict): return
+        packet_type = data.get("type")
+        if packet_type == "INIT":
+            self.client_seq = self.last_input_seq = data.get("seq", 0)
+            self.client_seq_time = time.perf_counter()
+            handle_init(self.player_id, data)
+            if data.get("zlib") and COMPRESSION_ENABLED: self.compressor = FrameCompressor()
+            rate = data.get("rate")
+            if isinstance(rate, int) and rate > 0: self.rate_limit = max(MIN_BANDWIDTH, min(BANDWIDTH_LIMIT, rate))
+            # Частота тика нужна клиенту для интерполяции, токен - для UDP
+            token = 0
+            if data.get("udp") and game_udp is not None:
+                udp_tokens[self.token] = self
+                token = self.token
+            self.send_frame(protocol.encode_welcome(token, GAME_PORT, tick_stats["rate"]))
+            # Полный снапшот со всем чатом - сразу, клиент ждет его блокирующим send
+            self.last_chat_seq = chat_seq
+            self.ready = True
+            self.send_snapshot(world_frame(), chat=list(chat_log), weights=interest_weights(self.player_id))
+        elif packet_type == "EVENTS":
+            self.handle_events(data)
+
+    def handle_input(self, data):
+        """Пакет команд ввода: новые команды - в inbox до тика, с временем приема"""
+        ack, _, commands = protocol.decode_input(data)
+        # Последний снапшот, который клиент получил - база для дельты
+        self.encoder.ack(ack)
+        now = time.perf_counter()
+        sent_at = self.snapshot_times.pop(ack, None)
+        if sent_at is not None:
+            self.rtt = _ewma(self.rtt, (now - sent_at) * 1000)
+            for old in [s for s in self.snapshot_times if s < ack]: del self.snapshot_times[old]
+            if self.player_id in players: players[self.player_id].ping = round(self.rtt)
+        for cmd in commands:
+            # По UDP команды приходят повторно и не по порядку - применяем только новые
+            if cmd.seq <= self.last_input_seq: continue
+            self.last_input_seq = cmd.seq
+            if self.queued_inputs >= MAX_QUEUED_INPUTS: continue
+            self.queued_inputs += 1
+            self.inbox.append((cmd, now))
+
+    def handle_events(self, events):
+        """Надежные события (чат, попадания) - как UPDATE без ввода"""
+        if isinstance(events, dict):
+            self.inbox.append(dict(events, type="UPDATE"))
+
+    def send_snapshot(self, frame, chat=None, weights=None):
+        """Дельта общего мира тика (protocol.WorldFrame) + свой чат и подтверждения.
+        weights - id в области интереса -> вес (interest_weights)"""
+        if self.write_stalled_since is not None and self.udp_addr is None:
+            # Клиент не успевает читать: новый мир вытесняет неотправленный.
+            # Чат копится в chat_log (последние 20) и уйдет с ним
+            if self.pending is not None:
+                self.stats["replaced"] += 1
+                if chat is None: chat = self.pending[1]
+            self.pending = (frame, chat, weights)
+            return
+        started = time.perf_counter()
+        bytes_before = self.stats["bytes_out"]
+        if chat is None:
+            # Отправляем только новые сообщения
+            chat = chat_since(self.last_chat_seq)
+            self.last_chat_seq = chat_seq
+        hold_ms = (started - self.client_seq_time) * 1000
+        visible = None if weights is None else weights.keys()
+        budget = self.rate_limit / tick_stats["rate"]
+
+        if self.udp_addr is None:
+            payload = self.encoder.encode(frame, chat, self.client_seq, hold_ms, visible, event_log, budget, weights)
+            self.stats["proc_ms"] = _ewma(self.stats["proc_ms"], (time.perf_counter() - started) * 1000)
+            self.send_frame(payload)
+            self.snapshot_times[self.encoder.seq] = time.perf_counter()
+        else:
+            # UDP: чат - надежными сообщениями, снапшот - ненадежно. Бюджет не больше
+            # датаграммы, по TCP уходит только то, что не ужать (новичку - полный мир)
+            try:
+                for msg in chat:
+                    self.channel.queue(msg.encode('utf-8')[:reliable.UDP_MAX_PAYLOAD])
+            except reliable.ChannelError as e:
+                print(f"[CLIENT {self.player_id}] {e}")
+                self.transport.abort()
+                return
+            # Место под чат к (пере)отправке - вычитаем заранее, иначе занятый мир
+            # забивает датаграмму целиком и очередь растет до ChannelError.
+            # Не больше половины: снапшот тоже должен идти
+            reserve = self.channel.due_size(reliable.UDP_MAX_PAYLOAD // 2)
+            budget = min(budget, reliable.UDP_MAX_PAYLOAD - reserve)
+            payload = self.encoder.encode(frame, (), self.client_seq, hold_ms, visible, event_log, budget, weights)
+            self.stats["proc_ms"] = _ewma(self.stats["proc_ms"], (time.perf_counter() - started) * 1000)
+            if len(payload) > reliable.UDP_MAX_PAYLOAD:
+                # Большой - по TCP, если там не пауза (иначе дождется следующего тика)
+                if self.write_stalled_since is None: self.send_frame(payload)
+                payload = b''
+            datagram = self.channel.build(reliable.KIND_SNAPSHOT, payload)
+            game_udp.sendto(datagram, self.udp_addr)
+            self.snapshot_times[self.encoder.seq] = time.perf_counter()
+            self.stats["frames_out"] += 1
+            self.stats["bytes_out"] += len(datagram)
+
+        # Фактическая скорость - в таблицу счета рядом с пингом (КБ/с)
+        self.rate = _ewma(self.rate, (self.stats["bytes_out"] - bytes_before) * tick_stats["rate"], 0.05)
+        if self.player_id in players: players[self.player_id].rate = round(self.rate / 1024)
+
+    def send_frame(self, payload):
+        started = time.perf_counter()
+        frame = self.compressor.pack(payload) if self.compressor else pack_frame(payload)
+        self.transport.write(frame)
+        self.stats["write_ms"] = _ewma(self.stats["write_ms"], (time.perf_counter() - started) * 1000)
+        self.stats["write_buffer"] = self.transport.get_write_buffer_size()
+        self.stats["frames_out"] += 1
+        self.stats["bytes_out"] += len(frame)
+
+    def expired(self, now):
+        """Причина закрыть соединение по сроку или None"""
+        if not self.ready and now - self.connected_at > INIT_TIMEOUT:
+            return "нет INIT"
+        if now - self.last_recv > IDLE_TIMEOUT:
+            return f"молчит {now - self.last_recv:.0f} с"
+        if self.write_stalled_since is not None and now - self.write_stalled_since > WRITE_TIMEOUT:
+            return f"не читает, в буфере {self.transport.get_write_buffer_size()} Б"
+        lag = self.encoder.seq - self.encoder.acked
+        if self.ready and lag > LAG_TIMEOUT * tick_stats["rate"]:
+            return f"не подтверждает снапшоты, отстал на {lag}"
+        return None
+
+def connection_stats():
+    """Статистика задержек по каждому соединению"""
+    return {c.player_id: dict(c.stats, addr=c.addr, rate=c.rate, rate_limit=c.rate_limit, deferred=c.encoder.deferred,
+                              zlib=c.compressor and dict(c.compressor.stats, ratio=c.compressor.ratio))
+            for c in list(connections)}
+
+def _fmt_ms(value):
+    return "-" if value is None else f"{value:.2f}"
+
+async def reaper_loop():
+    """Закрывает соединения, пропавшие без FIN или зависшие: close() ждал бы
+    отправки буфера, поэтому abort(). Игрока уберет connection_lost"""
+    while server_running:
+        await asyncio.sleep(REAP_INTERVAL)
+        now = time.perf_counter()
+        for conn in list(connections):
+            reason = conn.expired(now)
+            if reason:
+                print(f"[REAP] #{conn.player_id} {conn.addr}: {reason}")
+                conn.transport.abort()
+
+async def stats_report_loop():
+    # CPU процесса (process_time) за интервал и какая его часть ушла на тики.
+    # В режиме хоста сюда же входит поток клиента - смотреть на долю тиков
+    cpu_prev, wall_prev, busy_prev = time.process_time(), time.perf_counter(), tick_stats["busy_ms"]
+    while server_running:
+        await asyncio.sleep(STATS_INTERVAL)
+        cpu_now, wall_now, busy_now = time.process_time(), time.perf_counter(), tick_stats["busy_ms"]
+        wall = wall_now - wall_prev
+        cpu_pct = (cpu_now - cpu_prev) / wall * 100
+        tick_pct = (busy_now - busy_prev) / 1000 / wall * 100
+        cpu_prev, wall_prev, busy_prev = cpu_now, wall_now, busy_now
+        if connections:
+            phases = tick_stats["phase_ms"]
+            print(f"[TICK] #{tick_stats['tick']}: {_fmt_ms(tick_stats['tick_ms'])} ms "
+                  f"(ввод {_fmt_ms(phases['input'])}, симуляция {_fmt_ms(phases['sim'])}, "
+                  f"рассылка {_fmt_ms(phases['send'])}), опозданий {tick_stats['overruns']}; "
+                  f"CPU {cpu_pct:.0f}%, из них тики {tick_pct:.0f}%; "
+                  f"пуль {bullet_store.count} (слотов {bullet_store.capacity}); "
+                  f"попаданий клиентов принято {hit_stats['confirmed']}, отклонено {hit_stats['rejected']}")
+        if any(ai_stats["bots"]):
+            print(f"[AI] ботов по ярусам (ИИ раз в {'/'.join(map(str, AI_TIERS))} тиков): "
+                  f"{'/'.join(map(str, ai_stats['bots']))}, ms за тик "
+                  f"{'/'.join(_fmt_ms(ms) for ms in ai_stats['ms'])}, восприятие {_fmt_ms(ai_stats['perception_ms'])} ms")
+        for p_id, st in connection_stats().items():
+            print(f"[NET] #{p_id} {st['addr']}: read {_fmt_ms(st['read_ms'])} ms, "
+                  f"proc {_fmt_ms(st['proc_ms'])} ms, write {_fmt_ms(st['write_ms'])} ms, "
+                  f"in {st['frames_in']} / out {st['frames_out']} кадров, буфер {st['write_buffer']} Б, "
+                  f"вытеснено {st['replaced']}")
+            if st["rate"] is not None:
+                print(f"[RATE] #{p_id}: {st['rate'] / 1024:.1f} из {st['rate_limit'] / 1024:.0f} КБ/с, "
+                      f"отложено бюджетом {st['deferred']} изменений")
+            z = st["zlib"]
+            if z and z["frames"]:
+                print(f"[ZLIB] #{p_id}: сжато {z['frames']} кадров до {z['ratio'] * 100:.0f}%, "
+                      f"без сжатия {z['bypass']}, CPU {z['cpu_ms']:.1f} ms")
+
+async def serve(bind_ip, tick_rate=TICK_RATE):
+    loop = asyncio.get_running_loop()
     try:
-        s.bind((bind_ip, 5555))
-    except socket.error as e:
+        tcp_server = await loop.create_server(ClientConnection, bind_ip, GAME_PORT, reuse_address=True,
+                                              backlog=LISTEN_BACKLOG)
+    except OSError as e:
         print(f"Server Bind Error: {e}")
         return
+    print(f"Сервер запущен на {bind_ip}:{GAME_PORT}")
 
-    s.listen(4)
-    print(f"Сервер запущен на {bind_ip}:5555")
-    
-    # Запускаем фоновые потоки
-    start_new_thread(bot_simulation_thread, ())
-    start_new_thread(udp_broadcast_listener, ()) # Поток обнаружения
-    
-    # Главный цикл принятия подключений
-    while server_running:
+    # Игровой UDP на том же порту
+    global game_udp
+    game_udp = None
+    if UDP_ENABLED:
         try:
-            conn, addr = s.accept()
-            print(f"Подключился: {addr}")
-            players[current_id] = Player(random.randint(100, 800), random.randint(100, 800), 50, 50, (0, 255, 255), current_id)
-            start_new_thread(threaded_client, (conn, current_id))
-            current_id += 1
-        except OSError:
-            break # Сокет закрыт
+            game_udp, _ = await loop.create_datagram_endpoint(
+                GameDatagramProtocol, local_addr=(bind_ip, GAME_PORT))
+        except OSError as e:
+            print(f"[UDP] Игровой UDP недоступен, только TCP: {e}")
+
+    # Сервер обнаружения (UDP) в том же цикле событий
+    udp_transport = None
+    udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        udp_sock.bind(('', BROADCAST_PORT))
+        udp_transport, _ = await loop.create_datagram_endpoint(DiscoveryProtocol, sock=udp_sock)
+    except OSError as e:
+        print(f"[UDP] Ошибка бинда порта обнаружения: {e}")
+        udp_sock.close()
+
+    tasks = [asyncio.create_task(tick_loop(tick_rate)),
+             asyncio.create_task(reaper_loop()),
+             asyncio.create_task(stats_report_loop())]
+
+    # main.py останавливает сервер флагом server_running
+    while server_running:
+        await asyncio.sleep(0.5)
+
+    for task in tasks: task.cancel()
+    tcp_server.close()
+    for conn in list(connections): conn.transport.close()
+    if udp_transport: udp_transport.close()
+    if game_udp: game_udp.close()
+    await tcp_server.wait_closed()
+
+def new_event_loop():
+    """Цикл событий на selectors: один поток, неблокирующие сокеты, epoll на Linux,
+    kqueue на macOS/BSD. Явно, потому что на Windows asyncio по умолчанию берет
+    Proactor (IOCP), а нам везде нужен один и тот же цикл"""
+    selector = selectors.DefaultSelector()
+    print(f"[LOOP] {type(selector).__name__}")
+    return asyncio.SelectorEventLoop(selector)
+
+def start_server_instance(bind_ip="0.0.0.0", tick_rate=TICK_RATE):
+    """Основная функция запуска сервера (блокирует поток до остановки)"""
+    reset_server_state(tick_rate)
+    tick_stats.update(tick=0, tick_ms=None, overruns=0, rate=tick_rate,
+                      phase_ms={"input": None, "sim": None, "send": None}, busy_ms=0.0)
+    loop = new_event_loop()
+    try:
+        loop.run_until_complete(serve(bind_ip, tick_rate))
+    finally:
+        loop.close()
 
 # Блок для прямого запуска файла server.py
 if __name__ == "__main__":
@@ -341,4 +938,4 @@ if __name__ == "__main__":
         except: return "127.0.0.1"
 
     print(f"Локальный IP: {get_local_ip()}")
-    start_server_instance()
\ No newline at end of file
+    start_server_instance()
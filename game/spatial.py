@@ -0,0 +1,108 @@
+# --- ПРОСТРАНСТВЕННЫЙ ИНДЕКС ---
+# Равномерная сетка по карте: клетка -> id объектов в ней.
+# Перестраивается раз за тик, после чего запросы "кто рядом" смотрят
+# только соседние клетки, а не всех игроков.
+# SpatialGrid - точки (центры игроков для области интереса),
+# BoxGrid - прямоугольники (грубая фаза столкновений пуль со стенами и игроками).
+
+
+class SpatialGrid:
+    """Равномерная сетка с запросом по радиусу"""
+
+    def __init__(self, cell_size=250):
+        self.cell_size = cell_size
+        self.cells = {}      # (cx, cy) -> [id]
+        self.positions = {}  # id -> (x, y)
+
+    def cell_of(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def rebuild(self, items):
+        """items - (id, x, y). Старое содержимое выбрасывается"""
+        self.cells = {}
+        self.positions = {}
+        for item_id, x, y in items:
+            self.cells.setdefault(self.cell_of(x, y), []).append(item_id)
+            self.positions[item_id] = (x, y)
+
+    def query_radius(self, x, y, radius):
+        """id объектов не дальше radius от точки"""
+        found = set()
+        r2 = radius * radius
+        cx0, cy0 = self.cell_of(x - radius, y - radius)
+        cx1, cy1 = self.cell_of(x + radius, y + radius)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for item_id in self.cells.get((cx, cy), ()):
+                    px, py = self.positions[item_id]
+                    if (px - x) ** 2 + (py - y) ** 2 <= r2:
+                        found.add(item_id)
+        return found
+
+
+class BoxGrid:
+    """Равномерная сетка прямоугольников (x, y, w, h): объект лежит во всех
+    клетках, которые задевает. Запрос отдает кандидатов на пересечение -
+    точную проверку (colliderect) делает вызывающий"""
+
+    def __init__(self, cell_size=100):
+        self.cell_size = cell_size
+        self.cells = {}  # (cx, cy) -> {id}
+        self.boxes = {}  # id -> (x, y, w, h)
+        self.spans = {}  # id -> (cx0, cy0, cx1, cy1) занятых клеток
+
+    def span(self, x, y, w, h):
+        size = self.cell_size
+        return int(x // size), int(y // size), int((x + w) // size), int((y + h) // size)
+
+    def _add(self, item_id, span):
+        cx0, cy0, cx1, cy1 = span
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.cells.setdefault((cx, cy), set()).add(item_id)
+
+    def _discard(self, item_id, span):
+        cx0, cy0, cx1, cy1 = span
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = self.cells.get((cx, cy))
+                if cell is None: continue
+                cell.discard(item_id)
+                if not cell: del self.cells[(cx, cy)]
+
+    def insert(self, item_id, x, y, w, h):
+        """Добавляет или переносит объект (клетки меняются, только если он их сменил)"""
+        span = self.span(x, y, w, h)
+        old = self.spans.get(item_id)
+        if old != span:
+            if old is not None: self._discard(item_id, old)
+            self._add(item_id, span)
+            self.spans[item_id] = span
+        self.boxes[item_id] = (x, y, w, h)
+
+    def remove(self, item_id):
+        span = self.spans.pop(item_id, None)
+        if span is None: return
+        self._discard(item_id, span)
+        del self.boxes[item_id]
+
+    def rebuild(self, items):
+        """items - (id, x, y, w, h). Старое содержимое выбрасывается"""
+        self.cells = {}
+        self.boxes = {}
+        self.spans = {}
+        for item_id, x, y, w, h in items:
+            self.insert(item_id, x, y, w, h)
+
+    def query_box(self, x, y, w, h):
+        """id объектов, чьи прямоугольники пересекают данный (включая касание)"""
+        found = set()
+        cx0, cy0, cx1, cy1 = self.span(x, y, w, h)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for item_id in self.cells.get((cx, cy), ()):
+                    if item_id in found: continue
+                    bx, by, bw, bh = self.boxes[item_id]
+                    if bx <= x + w and x <= bx + bw and by <= y + h and y <= by + bh:
+                        found.add(item_id)
+        return found
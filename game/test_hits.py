@@ -0,0 +1,104 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import threading
+import time
+import unittest
+import pygame
+import protocol
+import server
+from network import Network
+
+# --- ПОПАДАНИЯ ЧЕРЕЗ НАСТОЯЩИЙ СЕРВЕР ---
+# Стрелок A и цель B - обычные клиенты Network на 127.0.0.1. A стреляет и
+# ищет попадания своих пуль так же, как main.py (предсказанные пули против
+# цели в момент интерполяции), и шлет их серверу. Сервер должен засчитать
+# почти все: отказ - значит confirm_hit ищет пулю не там, где она была у клиента.
+
+FPS = 60
+MAP_WIDTH = MAP_HEIGHT = 2000
+SHOOTER_POS = (500, 1000)
+TARGET_POS = (800, 1000)
+SHOT_EVERY = 20     # кадров между выстрелами
+FRAMES = 420
+MIN_REPORTED = 8
+MIN_CONFIRMED = 0.8 # доля засчитанных от присланных
+
+
+class HitConfirmationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.thread = threading.Thread(target=server.start_server_instance, args=("127.0.0.1", 30), daemon=True)
+        cls.thread.start()
+        time.sleep(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        server.server_running = False
+        cls.thread.join(5)
+
+    def connect(self, use_udp, pos):
+        n = Network("127.0.0.1", use_udp=use_udp)
+        p = n.getP()
+        self.assertIsNotNone(p)
+        self.addCleanup(n.disconnect)
+        n.send({"type": "INIT", "skin": "DEFAULT", "nick": f"T{p.id}"})
+        n.start_pipeline()
+        # Ставим игрока на место и на сервере, и у себя (ввода движения у A нет)
+        srv_p = server.players[p.id]
+        srv_p.x, srv_p.y = p.x, p.y = pos
+        srv_p.update_rect(); p.update_rect()
+        return n, p
+
+    def play(self, use_udp):
+        a, pa = self.connect(use_udp, SHOOTER_POS)
+        b, pb = self.connect(use_udp, TARGET_POS)
+        before = dict(server.hit_stats)
+        reported = 0
+        for frame in range(FRAMES):
+            started = time.perf_counter()
+            a.poll()
+            t = a.interp.render_time()
+            target = a.interp.sample(pb.id, t) if t is not None else None
+            buttons, aim = 0, 0.0
+            if target is not None and frame % SHOT_EVERY == 0:
+                buttons |= protocol.BTN_FIRE
+                aim = pa.aim_angle(target[0] + pb.width // 2, target[1] + pb.height // 2)
+            cmd = protocol.InputCommand.build(0, 0, aim, buttons)
+            pa.apply_input(cmd, MAP_WIDTH, MAP_HEIGHT)
+            # Как в main.py: свои пули против цели, какой ее видно сейчас
+            hits = []
+            if target is not None:
+                rect = pygame.Rect(int(target[0]), int(target[1]), pb.width, pb.height)
+                for bullet in list(pa.bullets):
+                    if pygame.Rect(bullet[0] - 5, bullet[1] - 5, 10, 10).colliderect(rect):
+                        pa.deleteBullet(bullet)
+                        hits.append({"target_id": pb.id, "damage": 10})
+            reported += len(hits)
+            a.post_input(cmd, {"hits": hits} if hits else None)
+            # Цель ходит вверх-вниз с паузами: попадание проверяется в отмотанном положении
+            phase = frame // 30 % 4
+            b.post_input(protocol.InputCommand.build(0, (0, 1, 0, -1)[phase], 0.0, 0))
+            b.poll()
+            time.sleep(max(0.0, 1 / FPS - (time.perf_counter() - started)))
+        time.sleep(0.3) # последние отчеты доходят до тика
+        confirmed = server.hit_stats["confirmed"] - before["confirmed"]
+        rejected = server.hit_stats["rejected"] - before["rejected"]
+        return reported, confirmed, rejected
+
+    def check(self, use_udp):
+        reported, confirmed, rejected = self.play(use_udp)
+        self.assertGreaterEqual(reported, MIN_REPORTED)
+        self.assertEqual(confirmed + rejected, reported)
+        self.assertGreaterEqual(confirmed, MIN_CONFIRMED * reported,
+                                f"засчитано {confirmed} из {reported}")
+
+    def test_tcp(self):
+        self.check(use_udp=False)
+
+    def test_udp(self):
+        self.check(use_udp=True)
+
+
+if __name__ == "__main__":
+    unittest.main()